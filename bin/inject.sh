@@ -1,6 +1,7 @@
 #!/bin/bash -e
 #
 # Mass inject the trades.gz dataset 
+# (or a RESP bulk load file given as the first argument: ./generator.py|dump.py --resp-file <file>.gz|.zst|.resp)
 #
 CONFIG="../config/azfinsim.config"
 if [ -f $CONFIG ]; then
@@ -15,5 +16,11 @@ fi
 AZFINSIM_REDIS_KEY=$(az keyvault secret show --name $AZFINSIM_REDIS_SECRET_ID --vault-name $AZFINSIM_KV_NAME --query "value" | tr -d '",')
 
 #-- inject 
-echo "Injecting 1 million trades into cache $AZFINSIM_REDISHOST:6379"
-time zcat ../data/trades.gz | redis-cli -h $AZFINSIM_REDISHOST -p 6379 -a $AZFINSIM_REDIS_KEY --pipe
+DATASET=${1:-../data/trades.gz}
+case $DATASET in
+   *.gz)  CAT=zcat ;;
+   *.zst) CAT=zstdcat ;;
+   *)     CAT=cat ;;
+esac
+echo "Injecting $DATASET into cache $AZFINSIM_REDISHOST:6379"
+time $CAT $DATASET | redis-cli -h $AZFINSIM_REDISHOST -p 6379 -a $AZFINSIM_REDIS_KEY --pipe
@@ -3,9 +3,14 @@
 # This is the main execution engine that runs on the pool nodes
 
 import argparse
+import os
 import time
 import sys
 import logging
+import multiprocessing
+import queue
+import threading
+import numpy as np
 import pandas as pd
 
 from applicationinsights import TelemetryClient
@@ -23,6 +28,373 @@ launch=time.time()
 log = azlog.getLogger(__name__)
 azlog.color=False
 
+def price_batches(args, r, tc, writer, results, start_trade, stop_trade):
+    ''' price the trade window --batch-size trades at a time: one vectorized
+        montecarlo.price_portfolio() call per batch instead of one call per trade '''
+
+    if (args.format != "eyxml" and args.format != "eybin"):
+        log.error("ERROR - only eyxml & eybin formats supported currently.")
+        sys.exit(1)
+    #-- price_portfolio() is the stream kernel with single pass (crn) bumps: ask for exactly that
+    if (args.kernel != "stream" or (args.algorithm == "deltavega" and args.risk_engine != "crn")):
+        log.error("ERROR - --batch-size prices with the stream kernel and crn bumps: add --kernel stream%s" %
+                  (" --risk-engine crn" if args.algorithm == "deltavega" else ""))
+        sys.exit(1)
+    if (args.variance != "none" or args.target_stderr > 0 or args.target_rel_stderr > 0):
+        log.error("ERROR - --batch-size does not support --variance or adaptive paths (--target-stderr/--target-rel-stderr)")
+        sys.exit(1)
+
+    for batch_start in range(start_trade, stop_trade, args.batch_size):
+
+        batch_start_time=time.time()
+        tradenums = range(batch_start, min(batch_start+args.batch_size, stop_trade))
+        ntrades = len(tradenums)
+
+        #-- read the batch from cache
+        start=time.perf_counter()
+        xmlstrings = list(utils.PrefetchTrades(r, args.format, tradenums, ntrades))  #-- one MGET per batch
+        end=time.perf_counter()
+        timedelta=end-start
+        log.info("TRADE %10d: REDISREAD : %.12f (batch of %d)" % (batch_start,timedelta,ntrades))
+        tc.track_metric('REDISREAD', timedelta/ntrades)
+
+        #-- Inject Random Failure 
+        if (utils.InjectRandomFail(args.failure)):
+            tc.track_metric('ERROR', timedelta)
+            sys.exit(1)
+
+        for tradenum, xmlstring in zip(tradenums, xmlstrings):
+            if xmlstring is None:
+                log.error("TRADE %10d: trade %s not in the cache" % (tradenum,utils.TradeKey(args.format, tradenum)))
+                tc.track_metric('ERROR', timedelta)
+                sys.exit(1)
+
+        if (args.format == "eybin"): trades = xmlutils.ParseEYBINFrame(xmlstrings)
+        else: trades = pd.DataFrame([xmlutils.ParseEYXMLFast(xmlstring) for xmlstring in xmlstrings])
+
+        start=time.perf_counter()
+        if (args.seed is None): rng = None
+        else: rng = [montecarlo.trade_seed(args.seed, tradenum) for tradenum in tradenums]
+        out = montecarlo.price_portfolio(trades, args.algorithm == "deltavega", chunk_size=args.chunk_size, rng=rng,
+                                         barrier=args.barrier, grid=args.grid)
+        for i, tradenum in enumerate(tradenums):
+            results.loc[tradenum, 'PV'] = out[0][i]
+            results.loc[tradenum, 'PV_time'] = out[1]/ntrades
+            results.loc[tradenum, 'Delta'] = out[2][i]
+            results.loc[tradenum, 'Vega'] = out[3][i]
+            results.loc[tradenum, 'Compute'] = out[1]/ntrades
+            results.loc[tradenum, 'StdErr'] = out[4][i]
+            results.loc[tradenum, 'Paths'] = out[5][i]
+            log.info("TRADE %10d: RESULT: PV (netSettlement) = %f" % (tradenum,out[0][i]))
+            log.info("TRADE %10d: STDERR: %f (%d paths, variance reduction: %s)" % (tradenum,out[4][i],out[5][i],args.variance))
+            log.info("TRADE %10d: PATHS : %d" % (tradenum,out[5][i]))
+            tc.track_metric('PV', out[0][i])
+            tc.track_metric('STDERR', out[4][i])
+            tc.track_metric('PATHS', out[5][i])
+            if (args.algorithm == "deltavega"):
+                log.info("TRADE %10d: DELTA: %.12f" % (tradenum,out[2][i]))
+                log.info("TRADE %10d: VEGA: %.12f" % (tradenum,out[3][i]))
+                tc.track_metric('DELTA', out[2][i])
+                tc.track_metric('VEGA', out[3][i])
+        end=time.perf_counter()
+        timedelta=end-start
+        log.info("TRADE %10d: PVTIME: = %f (batch of %d)" % (batch_start,out[1],ntrades))
+        log.info("TRADE %10d: COMPUTE : %.12f (batch of %d)" % (batch_start,timedelta,ntrades))
+        tc.track_metric('PVTIME', out[1]/ntrades)
+        tc.track_metric('COMPUTE', timedelta/ntrades)
+
+        #-- log time to process one trade
+        timedelta = (time.time() - batch_start_time)/ntrades
+        log.info("TRADE %10d: TRADETIME : %.12f (batch average)" % (batch_start,timedelta))
+        tc.track_metric('TRADETIME', timedelta)
+        for tradenum in tradenums:
+            writer.add(tradenum, {**results.loc[tradenum].to_dict(), 'TradeTime': timedelta})
+        tc.flush()
+
+def price_trade(args, r, tc, tradenum, reader=None):
+    ''' read and price a single trade: returns the results row (dict) and the trade read from cache
+        (reader: optional utils.PrefetchTrades(timed=True) generator to take the trade and its read
+        time from instead of the cache) '''
+
+    res = {}
+
+    keyname = utils.TradeKey(args.format, tradenum)
+
+    log.debug("Retrieving Trade: %s" % keyname)
+    #-- read trade from cache
+    if reader is None:
+        start=time.perf_counter()
+        xmlstring=utils.GetTrade(r,keyname)
+        #-- stress: time reading the bytes, not mapping a zero copy view of them (filesystem cache)
+        if (args.algorithm == "stress" and xmlstring is not None): xmlstring=bytes(xmlstring)
+        end=time.perf_counter()
+        timedelta=end-start
+    else:
+        #-- prefetched: this trade's share of its block read, not the time next() takes
+        xmlstring, timedelta = next(reader)
+    log.debug("XMLREAD: %s" % xmlstring)
+    log.info("TRADE %10d: REDISREAD : %.12f" % (tradenum,timedelta))
+    tc.track_metric('REDISREAD', timedelta)
+    tc.flush()
+
+    if xmlstring is None:
+        log.error("TRADE %10d: trade %s not in the cache" % (tradenum,keyname))
+        tc.track_metric('ERROR', timedelta)
+        sys.exit(1)
+
+    #-- Inject Random Failure 
+    if (utils.InjectRandomFail(args.failure)):
+        tc.track_metric('ERROR', timedelta)
+        sys.exit(1)
+
+    if (args.algorithm == "synthetic"): 
+    #-- fake pricing computation - tunable duration - mainly for benchmarking schedulers
+        start=time.perf_counter()
+        if (args.task_duration > 0):
+            utils.DoFakeCompute(xmlstring,args.delay_start,args.task_duration,args.mem_usage)
+        end=time.perf_counter()
+        timedelta=end-start
+        log.info("TRADE %10d: COMPUTE : %.12f" % (tradenum,timedelta))
+        tc.track_metric('COMPUTE', timedelta)
+        res['Compute'] = timedelta
+
+    if (args.algorithm == "stress"):
+    #-- cache bandwidth: no pricing, the trade just read is written back at full size (--nbytes sets the size)
+        readtime = timedelta
+        nbytes = len(xmlstring)
+        start=time.perf_counter()
+        r.set(utils.StressKey(args.format,tradenum),utils.Encode(xmlstring))
+        end=time.perf_counter()
+        timedelta=end-start
+        log.info("TRADE %10d: REDISWRITE: %.12f (%d bytes)" % (tradenum,timedelta,nbytes))
+        tc.track_metric('STRESSWRITE', timedelta)
+        res['Bytes'] = nbytes
+        res['ReadTime'] = readtime
+        res['WriteTime'] = timedelta
+        res['Compute'] = timedelta
+
+    if (args.algorithm in ["pvonly","deltavega","pathwise","likelihood"]): 
+        #-- other formats are legacy
+        if (args.format != "eyxml" and args.format != "eybin"):
+            log.error("ERROR - only eyxml & eybin formats supported currently.")
+            sys.exit(1)
+
+        #-- If EY format, run a real pricing/monte-carlo simulation with EY Quant code
+        if (args.format == "eybin"):
+            trade=xmlutils.ParseEYBIN(xmlstring) #- fixed layout record, no xml/dataframe step
+        else:
+            trade=xmlutils.ParseEYXMLFast(xmlstring) #- first trade as a dict, no element tree/dataframe
+        #-- reproducible per-trade random stream when a job seed is given
+        if (args.seed is None): rng = None
+        else: rng = montecarlo.trade_seed(args.seed, tradenum)
+        steps = montecarlo.grid_steps(args.grid, trade['t_steps'])
+        log.debug("XMLPARSE: dataframe %d: %f" % (tradenum,trade['fx1']))
+
+        start=time.perf_counter()
+
+        if (args.algorithm == "deltavega" and args.risk_engine == "crn"):
+            #-- PV, Delta & Vega in one pass over shared random numbers
+            out = montecarlo.risk_crn(trade, chunk_size=args.chunk_size, rng=rng, barrier=args.barrier, nsteps=steps)
+            res['Delta'] = out[2]
+            res['Vega'] = out[3]
+            stderr, paths = out[4:6]
+        elif (args.algorithm == "pathwise" or args.algorithm == "likelihood"):
+            #-- Delta & Vega estimated from the same paths as the PV
+            out = montecarlo.risk_analytic(trade, args.algorithm, args.chunk_size, rng, steps)
+            res['Delta'] = out[2]
+            res['Vega'] = out[3]
+            stderr, paths = out[4:6]
+        else:
+            #results.loc[tradenum] = montecarlo.price_option(tradenum,input_file)
+            if (args.target_stderr > 0 or args.target_rel_stderr > 0):
+                #-- adaptive path count: stop as soon as the PV standard error hits the target
+                out = montecarlo.price_adaptive(trade,args.target_stderr,args.target_rel_stderr,args.max_trials,
+                                                args.chunk_size,rng,args.variance,args.barrier,steps)
+            else:
+                out = montecarlo.price_option(trade,args.kernel,args.chunk_size,rng,args.variance,args.barrier,steps)
+            stderr, paths = out[2:4]
+        #-- standard error of the PV and paths behind it, whichever engine priced the trade
+        res['StdErr'] = stderr
+        res['Paths'] = paths
+        log.info("TRADE %10d: STDERR: %f (%d paths, variance reduction: %s)" % (tradenum,stderr,paths,args.variance))
+        log.info("TRADE %10d: PATHS : %d" % (tradenum,paths))
+        tc.track_metric('STDERR', stderr)
+        tc.track_metric('PATHS', paths)
+        res['PV'] = out[0]
+        res['PV_time'] = out[1]
+        #res['Label'] = 1 if out[0]!=0 else 0
+        tc.track_metric('PVTIME', res['PV_time'])
+        tc.track_metric('PV', res['PV'])
+        #logging.info("TRADE %10d: RESULT: netSettlement = %f" % (tradenum,res['netSettlement']))
+        log.info("TRADE %10d: PVTIME: = %f" % (tradenum,res['PV_time']))
+        log.info("TRADE %10d: RESULT: PV (netSettlement) = %f" % (tradenum,res['PV']))
+
+        #--- Perform delta vega risk calculation
+        if (args.algorithm != "pvonly"): 
+            if (args.algorithm == "deltavega" and args.risk_engine == "bump"):
+                log.debug("TRADE %10d: Start Delta Vega" % tradenum)
+                res['Delta'] = montecarlo.risk('fx1', trade, kernel=args.kernel, chunk_size=args.chunk_size, rng=rng,
+                                               barrier=args.barrier, nsteps=steps)
+                res['Vega'] = montecarlo.risk('sigma1', trade, kernel=args.kernel, chunk_size=args.chunk_size, rng=rng,
+                                              barrier=args.barrier, nsteps=steps)
+            log.info("TRADE %10d: DELTA: %.12f" % (tradenum,res['Delta']))
+            log.info("TRADE %10d: VEGA: %.12f" % (tradenum,res['Vega']))
+            if (args.compare_fd and args.algorithm != "deltavega"):
+                #-- check the estimators against single pass finite differences
+                fd = montecarlo.risk_crn(trade, chunk_size=args.chunk_size, rng=rng, nsteps=steps)
+                log.info("TRADE %10d: DELTA_FD: %.12f DIFF: %.12f" % (tradenum,fd[2],res['Delta']-fd[2]))
+                log.info("TRADE %10d: VEGA_FD: %.12f DIFF: %.12f" % (tradenum,fd[3],res['Vega']-fd[3]))
+                tc.track_metric('DELTA_FD_DIFF', res['Delta']-fd[2])
+                tc.track_metric('VEGA_FD_DIFF', res['Vega']-fd[3])
+            #log.info("TRADE %10d: LABEL: %d" % (tradenum,res['Label']))
+            tc.track_metric('DELTA', res['Delta'])
+            tc.track_metric('VEGA', res['Vega'])
+            #tc.track_metric('LABEL', res['Label'])
+            tc.flush()
+
+        end=time.perf_counter()
+        timedelta=end-start
+        log.info("TRADE %10d: COMPUTE : %.12f" % (tradenum,timedelta))
+        tc.track_metric('COMPUTE', timedelta)
+        res['Compute'] = timedelta
+
+    return res, xmlstring
+
+#-- per process state of the --workers pool (set up once per worker by init_worker)
+worker = {}
+
+def init_worker(args):
+    ''' pool initializer: every worker process opens its own cache connection & telemetry client '''
+    worker['args'] = args
+    #-- the utils settings are module globals: only a forked worker inherits them (not spawn/forkserver)
+    utils.SetKeyLayout(args.key_layout,args.bucket_size)
+    utils.SetCodec(args.codec,args.codec_level)
+    utils.SetPoolOptions(args.pool_size,args.pool_timeout,args.socket_timeout,args.health_check_interval)
+    worker['r'] = utils.SetupCacheConn(args.cache_type,args.cache_name,args.cache_port,args.cache_key,args.cache_ssl,args.cache_path,args.seed)
+    worker['tc'] = TelemetryClient("%s" % args.appinsights_key)
+    #-- forked workers inherit the parent's global numpy random state: reseed so they do not share paths
+    if (args.seed is None): np.random.seed()
+
+def worker_trade(tradenum):
+    ''' price one trade in a pool worker: returns (tradenum, results row, trade time, worker pid,
+        the worker's cumulative pool counters) '''
+    trade_start_time=time.time()
+    try:
+        res, xmlstring = price_trade(worker['args'], worker['r'], worker['tc'], tradenum)
+    except SystemExit:
+        #-- a worker cannot exit the task itself: hand the failure back to the parent
+        return tradenum, None, 0.0, os.getpid(), utils.PoolStats()
+    worker['tc'].flush()
+    return tradenum, res, time.time()-trade_start_time, os.getpid(), utils.PoolStats()
+
+def price_workers(args, r, tc, writer, results, start_trade, stop_trade):
+    ''' price the trade window on a pool of --workers processes: results are gathered
+        in the parent and written back to the cache in batches by the result writer '''
+
+    #-- small chunks so that workers which draw cheap trades pull more of the window
+    ntrades = stop_trade - start_trade
+    chunksize = max(1, ntrades // (args.workers*4))
+    log.info("TRADE %10d: WORKERS : %d (chunks of %d trades)" % (start_trade,args.workers,chunksize))
+
+    #-- the workers' pool counters: cumulative per process, so keep the latest seen from each worker
+    pool_stats = {}
+    with multiprocessing.Pool(args.workers, initializer=init_worker, initargs=(args,)) as pool:
+        for tradenum, res, timedelta, pid, stats in pool.imap_unordered(worker_trade, range(start_trade,stop_trade), chunksize):
+            pool_stats[pid] = stats
+            if res is None:
+                log.error("TRADE %10d: worker failed, terminating pool" % tradenum)
+                pool.terminate()
+                tc.track_metric('ERROR', 0)
+                tc.flush()
+                sys.exit(1)
+            for k in res: results.loc[tradenum, k] = res[k]
+            log.info("TRADE %10d: TRADETIME : %.12f" % (tradenum,timedelta))
+            tc.track_metric('TRADETIME', timedelta)
+            writer.add(tradenum, {**res, 'TradeTime': timedelta})
+    #-- the end of run POOL log then covers the workers' cache reads as well as the parent's writes
+    for stats in pool_stats.values(): utils.AddPoolStats(stats)
+    tc.flush()
+
+def price_pipeline(args, r, tc, writer, results, start_trade, stop_trade):
+    ''' staged mode: a fetch thread reads the window ahead of pricing and a writer thread writes
+        results back in batches, so that cache latency is hidden behind compute.
+        The stages are joined by bounded queues of --queue-depth trades. '''
+
+    tradenums = range(start_trade, stop_trade)
+    inq = queue.Queue(args.queue_depth)
+    outq = queue.Queue(args.queue_depth)
+    #-- stall = time a stage spends blocked on its queues; depth = queue length seen by the consumer
+    stats = {'fetch_stall': 0.0, 'price_in_stall': 0.0, 'price_out_stall': 0.0, 'write_stall': 0.0,
+             'in_depth': 0, 'out_depth': 0}
+
+    def fetch():
+        try:
+            for item in utils.PrefetchTrades(r,args.format,tradenums,max(args.prefetch,1),tc,
+                                             copy=(args.algorithm == "stress"),timed=True):
+                start=time.perf_counter()
+                inq.put(item)
+                stats['fetch_stall'] += time.perf_counter()-start
+        finally:
+            inq.put(None)
+
+    def write():
+        while True:
+            start=time.perf_counter()
+            stats['out_depth'] += outq.qsize()
+            item = outq.get()
+            stats['write_stall'] += time.perf_counter()-start
+            if item is None: break
+            #-- the result writer batches the pipelined round trips
+            writer.add(*item)
+
+    def reader():
+        while True:
+            start=time.perf_counter()
+            stats['in_depth'] += inq.qsize()
+            item = inq.get()
+            stats['price_in_stall'] += time.perf_counter()-start
+            if item is None:
+                raise RuntimeError("pipeline fetch stage stopped early")
+            yield item
+
+    fetch_thread = threading.Thread(target=fetch, name="fetch", daemon=True)
+    write_thread = threading.Thread(target=write, name="write", daemon=True)
+    fetch_thread.start()
+    write_thread.start()
+    trades = reader()
+
+    for tradenum in tradenums:
+
+        trade_start_time=time.time()
+
+        res, xmlstring = price_trade(args, r, tc, tradenum, trades)
+        for k in res: results.loc[tradenum, k] = res[k]
+
+        #-- log time to process one trade
+        timedelta = time.time() - trade_start_time
+        log.info("TRADE %10d: TRADETIME : %.12f" % (tradenum,timedelta))
+        tc.track_metric('TRADETIME', timedelta)
+
+        start=time.perf_counter()
+        outq.put((tradenum, {**res, 'TradeTime': timedelta}))
+        stats['price_out_stall'] += time.perf_counter()-start
+
+    outq.put(None)
+    fetch_thread.join()
+    write_thread.join()
+
+    ntrades = max(len(tradenums), 1)
+    log.info("TRADE %10d: PIPELINE : stall (s) fetch %.6f price(in) %.6f price(out) %.6f write %.6f" %
+             (start_trade,stats['fetch_stall'],stats['price_in_stall'],stats['price_out_stall'],stats['write_stall']))
+    log.info("TRADE %10d: PIPELINE : mean queue depth in %.2f out %.2f (max %d)" %
+             (start_trade,stats['in_depth']/ntrades,stats['out_depth']/ntrades,args.queue_depth))
+    tc.track_metric('FETCHSTALL', stats['fetch_stall'])
+    tc.track_metric('PRICESTALL', stats['price_in_stall']+stats['price_out_stall'])
+    tc.track_metric('WRITESTALL', stats['write_stall'])
+    tc.track_metric('INQUEUEDEPTH', stats['in_depth']/ntrades)
+    tc.track_metric('OUTQUEUEDEPTH', stats['out_depth']/ntrades)
+    tc.flush()
+
 if __name__ == "__main__":
 
     #-- grab cli args
@@ -57,8 +429,36 @@ if __name__ == "__main__":
     tc.track_metric('STARTTIME', launch)
 
     #-- open connection to cache
-    if (args.cache_type == "redis" or args.cache_type == "hazelcast"):
-        r = utils.SetupCacheConn(args.cache_type,args.cache_name,args.cache_port,args.cache_key,args.cache_ssl)
+    utils.SetKeyLayout(args.key_layout,args.bucket_size)
+    utils.SetCodec(args.codec,args.codec_level)
+    utils.SetPoolOptions(args.pool_size,args.pool_timeout,args.socket_timeout,args.health_check_interval)
+    if (args.cache_type == "virtual" and args.format == "varxml"):
+        log.error("the virtual cache synthesises eyxml/eybin trades only")
+        sys.exit(1)
+    if (args.workers > 1 and ((args.batch_size > 1 and args.algorithm in ["pvonly","deltavega"]) or args.pipeline or args.prefetch > 0)):
+        #-- each worker task reads & prices a single trade: none of these modes would be applied
+        log.error("--workers cannot be combined with --batch-size, --pipeline or --prefetch")
+        sys.exit(1)
+    if (args.pipeline and args.batch_size > 1 and args.algorithm in ["pvonly","deltavega"]):
+        #-- batched mode prices the whole window itself: the pipeline stages would never run
+        log.error("--pipeline cannot be combined with --batch-size")
+        sys.exit(1)
+    if (args.prefetch > 0 and args.batch_size > 1 and args.algorithm in ["pvonly","deltavega"]):
+        #-- batched mode already reads each --batch-size batch with a single MGET
+        log.error("--prefetch cannot be combined with --batch-size: each batch is already read in one round trip")
+        sys.exit(1)
+    if ((args.algorithm in ["pathwise","likelihood"] or (args.algorithm == "deltavega" and args.risk_engine == "crn")) and
+        (args.variance != "none" or args.target_stderr > 0 or args.target_rel_stderr > 0)):
+        #-- risk_crn()/risk_analytic() simulate plain pseudo random paths with a fixed path count
+        log.error("--variance and adaptive paths (--target-stderr/--target-rel-stderr) are not supported by the %s engine" %
+                  ("crn" if args.algorithm == "deltavega" else args.algorithm))
+        sys.exit(1)
+    if (args.barrier == "bridge" and args.algorithm in ["pathwise","likelihood"]):
+        #-- the pathwise/likelihood estimators have no brownian bridge term
+        log.error("--barrier bridge is not supported by the %s greeks: use --algorithm deltavega" % args.algorithm)
+        sys.exit(1)
+    if (args.cache_type == "redis" or args.cache_type == "hazelcast" or args.cache_type == "filesystem" or args.cache_type == "virtual"):
+        r = utils.SetupCacheConn(args.cache_type,args.cache_name,args.cache_port,args.cache_key,args.cache_ssl,args.cache_path,args.seed)
         if r is None:
              logging.error("Cannot connect to Redis DB: %s, %s, %s" % args.cache_name,args.cache_port,args.cache_key)
 
@@ -66,105 +466,68 @@ if __name__ == "__main__":
     stop_trade=start_trade+args.trade_window
 
     #results = pd.DataFrame(columns = ['netSettlement', 'Time'])
-    results = pd.DataFrame(columns = ['PV','PV_time', 'Delta', 'Vega', 'Label'])
+    results = pd.DataFrame(columns = ['PV','PV_time', 'Delta', 'Vega', 'StdErr', 'Paths', 'Compute', 'Label'])
+    writer = utils.ResultWriter(args.cache_type,r,args.format,args.write_batch,args.write_interval,tc)
     #input_file = pd.DataFrame(columns=['fx1','start_date','end_date','drift','maturity',
     #                                  't_steps','trials','ro','v','sigma1','warrantsNo','notionalPerWarr','strike'])
 
-    for tradenum in range(start_trade,stop_trade):
+    if (args.batch_size > 1 and args.algorithm in ["pvonly","deltavega"]):
+        #-- batched mode: the whole window is priced by price_batches()
+        price_batches(args,r,tc,writer,results,start_trade,stop_trade)
+        tradenums = []
+    elif (args.workers > 1):
+        #-- multi-process mode: the whole window is priced by price_workers()
+        price_workers(args,r,tc,writer,results,start_trade,stop_trade)
+        tradenums = []
+    elif (args.pipeline):
+        #-- staged mode: fetch / price / write overlapped by price_pipeline()
+        price_pipeline(args,r,tc,writer,results,start_trade,stop_trade)
+        tradenums = []
+    else:
+        tradenums = range(start_trade,stop_trade)
+
+    #-- prefetch the window --prefetch trades per round trip
+    if (args.prefetch > 0):
+        reader = utils.PrefetchTrades(r,args.format,tradenums,args.prefetch,tc,copy=(args.algorithm == "stress"),timed=True)
+    else: reader = None
+
+    for tradenum in tradenums:
 
         trade_start_time=time.time()
 
-        if (args.format == "varxml"): keyname = "var%007d.xml" % tradenum
-        else: keyname = "ey%007d.xml" % tradenum
-
-        log.debug("Retrieving Trade: %s" % keyname)
-	    #-- read trade from cache
-        start=time.perf_counter()
-        xmlstring=utils.GetTrade(r,keyname)
-        log.debug("XMLREAD: %s" % xmlstring)
-        end=time.perf_counter()
-        timedelta=end-start
-        log.info("TRADE %10d: REDISREAD : %.12f" % (tradenum,timedelta))
-        tc.track_metric('REDISREAD', timedelta)
-        tc.flush()
-
-        #-- Inject Random Failure 
-        if (utils.InjectRandomFail(args.failure)):
-            tc.track_metric('ERROR', timedelta)
-            sys.exit(1)
-
-        if (args.algorithm == "synthetic"): 
-	    #-- fake pricing computation - tunable duration - mainly for benchmarking schedulers
-            start=time.perf_counter()
-            if (args.task_duration > 0):
-                utils.DoFakeCompute(xmlstring,args.delay_start,args.task_duration,args.mem_usage)
-            end=time.perf_counter()
-            timedelta=end-start
-            log.info("TRADE %10d: COMPUTE : %.12f" % (tradenum,timedelta))
-            tc.track_metric('COMPUTE', timedelta)
-
-        if (args.algorithm == "pvonly" or args.algorithm == "deltavega" ): 
-            #-- other formats are legacy
-            if (args.format != "eyxml"):
-                log.error("ERROR - only eyxml format supported currently.")
-                sys.exit(1)
-
-            #-- If EY format, run a real pricing/monte-carlo simulation with EY Quant code
-            input_file=xmlutils.ParseEYXML(xmlstring)
-            log.debug("XMLPARSE: dataframe %d: %f" % (tradenum,input_file['fx1']))
-
-            start=time.perf_counter()
-
-            if (args.algorithm == "pvonly"): 
-                #results.loc[tradenum] = montecarlo.price_option(tradenum,input_file)
-                #out = montecarlo.price_option(input_file[tradenum].to_dict())
-                out = montecarlo.price_option(input_file.loc[0].to_dict()) #- single row in dataframe TODO: save all & tab print
-                results.loc[tradenum, 'PV'] = out[0]
-                results.loc[tradenum, 'PV_time'] = out[1]
-                #results.loc[tradenum, 'Label'] = 1 if out[0]!=0 else 0
-                tc.track_metric('PVTIME', results.loc[tradenum,'PV_time'])
-                tc.track_metric('PV', results.loc[tradenum,'PV'])
-                #logging.info("TRADE %10d: RESULT: netSettlement = %f" % (tradenum,results.loc[tradenum,'netSettlement']))
-                log.info("TRADE %10d: PVTIME: = %f" % (tradenum,results.loc[tradenum,'PV_time']))
-                log.info("TRADE %10d: RESULT: PV (netSettlement) = %f" % (tradenum,results.loc[tradenum,'PV']))
-
-                #--- Perform timedelta vega risk calculation
-                if (args.algorithm == "deltavega"): 
-                    logging.debug("TRADE %10d: Start Delta Vega" % tradenum)
-                    #results.loc[tradenum, 'Delta'] = montecarlo.risk('fx1', input_file.loc[tradenum].to_dict())
-                    #results.loc[tradenum, 'Vega'] = montecarlo.risk('sigma1', input_file.loc[tradenum].to_dict())
-                    results.loc[tradenum, 'Delta'] = montecarlo.risk('fx1', input_file.loc[0].to_dict())
-                    results.loc[tradenum, 'Vega'] = montecarlo.risk('sigma1', input_file.loc[0].to_dict())
-                    end=time.perf_counter()
-                    timedelta=end-start
-                    log.info("TRADE %10d: DELTA: %.12f" % (tradenum,results.loc[tradenum,'Delta']))
-                    log.info("TRADE %10d: VEGA: %.12f" % (tradenum,results.loc[tradenum,'Vega']))
-                    #log.info("TRADE %10d: LABEL: %d" % (tradenum,results.loc[tradenum,'Label']))
-                    tc.track_metric('PV', results.loc[tradenum,'PV'])
-                    tc.track_metric('DELTA', results.loc[tradenum,'Delta'])
-                    tc.track_metric('VEGA', results.loc[tradenum,'Vega'])
-                    #tc.track_metric('LABEL', results.loc[tradenum,'Label'])
-                    tc.flush()
-
-            end=time.perf_counter()
-            timedelta=end-start
-            log.info("TRADE %10d: COMPUTE : %.12f" % (tradenum,timedelta))
-            tc.track_metric('COMPUTE', timedelta)
-
-	#-- write result back to cache
-        start=time.perf_counter()
-        #utils.PutTrade("output",r,tradenum,xmlstring)
-        utils.PutTrade(args.cache_type,"output",r,args.format,tradenum,xmlstring)
-        end=time.perf_counter()
-        timedelta=end-start
-        log.info("TRADE %10d: REDISWRITE: %.12f" % (tradenum,timedelta))
-        tc.track_metric('REDISWRITE', timedelta)
+        res, xmlstring = price_trade(args, r, tc, tradenum, reader)
+        for k in res: results.loc[tradenum, k] = res[k]
 
         #-- log time to process one trade
         timedelta = time.time() - trade_start_time
         log.info("TRADE %10d: TRADETIME : %.12f" % (tradenum,timedelta))
         tc.track_metric('TRADETIME', timedelta)
 
+        #-- queue the result for (batched) write back to cache
+        writer.add(tradenum, {**res, 'TradeTime': timedelta})
+
+    #-- write any buffered results back to cache
+    writer.close()
+
+    #-- stress: cache throughput of the window (per trade read & write time, and over the wall clock)
+    if (args.algorithm == "stress" and 'Bytes' in results):
+        nbytes = results['Bytes'].sum()
+        readtime = results['ReadTime'].sum()
+        writetime = results['WriteTime'].sum()
+        elapsed = time.time() - launch
+        log.info("TRADE %10d: STRESS    : %d trades, %d bytes/trade, read %.1f MB/s, write %.1f MB/s, %.1f MB/s overall" %
+                 (args.start_trade,len(results),nbytes/max(len(results),1),nbytes/max(readtime,1e-9)/1e6,
+                  nbytes/max(writetime,1e-9)/1e6,2*nbytes/elapsed/1e6))
+        tc.track_metric('STRESSREADMBS', nbytes/max(readtime,1e-9)/1e6)
+        tc.track_metric('STRESSWRITEMBS', nbytes/max(writetime,1e-9)/1e6)
+
+    #-- connection pool health: time spent waiting for a connection & how often the pool ran dry
+    pool = utils.PoolStats()
+    log.info("TRADE %10d: POOL      : %d acquires, mean acquire %.9f, exhausted %d, failed %d" %
+             (args.start_trade,pool['acquires'],pool['acquire_mean'],pool['exhausted'],pool['failed']))
+    tc.track_metric('POOLACQUIRE', pool['acquire_mean'])
+    tc.track_metric('POOLEXHAUSTED', pool['exhausted'])
+
     #-- log finish time
     end=time.time()
     log.info("TRADE %10d: ENDTIME   : %d" % (args.start_trade,end))
@@ -91,4 +91,7 @@ def setDebug(b):
 
 def setColor(b):
     global color
-    color = b
\ No newline at end of file
+    color = b
+def setStream(stream):
+    ''' send the log to another stream, e.g. sys.stderr when stdout carries data '''
+    custom_handler.setStream(stream)
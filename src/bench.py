@@ -0,0 +1,158 @@
+#! /usr/bin/env python3
+#
+# bench.py: standalone micro-benchmarks for the pricing engine (no cache or azure services needed)
+#
+import argparse
+import logging
+import subprocess
+import threading
+import time
+import numpy as np
+
+import azlog
+import utils
+import xmlutils
+import montecarlo
+
+log = azlog.getLogger(__name__)
+
+#-- barrier: accuracy/speed of coarse time grids with & without the brownian bridge correction
+def bench_barrier(args):
+    np.random.seed(args.seed)
+    trade = xmlutils.ParseEYXML(xmlutils.GenerateTradeEY(0,1)).loc[0].to_dict()
+    trade['trials'] = args.trials
+    #-- put the barrier close to spot so that the knock out actually matters
+    trade['strike'] = trade['fx1'] - args.barrier_distance
+    t_steps = trade['t_steps']
+    rng = montecarlo.trade_seed(args.seed, 0)
+
+    ref = montecarlo.price_option(dict(trade), "stream", args.chunk_size, rng)
+    log.info("daily grid (%d steps, discrete): PV = %.2f +- %.2f in %.3fs" % (t_steps,ref[0],ref[2],ref[1]))
+    log.info("%8s %10s %16s %12s %12s %10s" % ("steps","barrier","PV","PV-daily","stderr","time(s)"))
+    for steps in [int(s) for s in args.grids.split(",")]:
+        for barrier in ["discrete","bridge"]:
+            out = montecarlo.price_option(dict(trade), "stream", args.chunk_size, rng, barrier=barrier, nsteps=steps)
+            log.info("%8d %10s %16.2f %12.2f %12.2f %10.3f" % (steps,barrier,out[0],out[0]-ref[0],out[2],out[1]))
+
+#-- parse: per trade cost of turning the cached trade into the pricing inputs
+def bench_parse(args):
+    np.random.seed(args.seed)
+    xmlstrings = [xmlutils.GenerateTradeEY(tradenum,1) for tradenum in range(args.trades)]
+    binstrings = [xmlutils.EYXMLToBin(xmlstring,tradenum) for tradenum, xmlstring in enumerate(xmlstrings)]
+    parsers = [("ParseEYXML + to_dict", lambda x, b: xmlutils.ParseEYXML(x).loc[0].to_dict()),
+               ("ParseEYXMLFast", lambda x, b: xmlutils.ParseEYXMLFast(x)),
+               ("ParseEYBIN", lambda x, b: xmlutils.ParseEYBIN(b))]
+    log.info("%24s %14s %10s" % ("parser","us/trade","speedup"))
+    base = None
+    for name, parse in parsers:
+        start = time.perf_counter()
+        for x, b in zip(xmlstrings, binstrings):
+            parse(x, b)
+        per_trade = (time.perf_counter() - start) / args.trades
+        base = base or per_trade
+        log.info("%24s %14.2f %10.1f" % (name,per_trade*1e6,base/per_trade))
+
+#-- codec: bytes per trade vs cpu per trade of each payload codec (skips codecs that are not installed)
+def bench_codec(args):
+    np.random.seed(args.seed)
+    payloads = {'eyxml': [xmlutils.GenerateTradeEY(tradenum,1) for tradenum in range(args.trades)],
+                'varxml': [xmlutils.GenerateTrade(tradenum,args.nbytes) for tradenum in range(args.trades)]}
+    payloads['eybin'] = [xmlutils.EYXMLToBin(x,tradenum) for tradenum, x in enumerate(payloads['eyxml'])]
+    utils.SetCodec("none", args.level)
+    log.info("%8s %6s %14s %8s %14s %14s" % ("format","codec","bytes/trade","ratio","encode us","decode us"))
+    for format, values in payloads.items():
+        raw = sum(len(v) for v in values) / len(values)
+        log.info("%8s %6s %14.1f %8.2f %14s %14s" % (format,"none",raw,1.0,"-","-"))
+        for name in ["zlib","lz4","zstd"]:
+            if not utils.CodecAvailable(name):
+                log.info("%8s %6s %14s" % (format,name,"not installed"))
+                continue
+            start = time.perf_counter()
+            encoded = [utils.Encode(v, name) for v in values]
+            encode = (time.perf_counter() - start) / len(values)
+            start = time.perf_counter()
+            decoded = [utils.Decode(v) for v in encoded]
+            decode = (time.perf_counter() - start) / len(values)
+            assert decoded == values
+            size = sum(len(v) for v in encoded) / len(values)
+            log.info("%8s %6s %14.1f %8.2f %14.2f %14.2f" % (format,name,size,raw/size,encode*1e6,decode*1e6))
+
+#-- shards: MGET read throughput of a trade window spread over 1..N redis instances
+def bench_shards(args):
+    servers = []
+    if (args.spawn > 0):
+        #-- local throw away redis-server processes (no persistence)
+        endpoints = ["127.0.0.1:%d" % (args.base_port+i) for i in range(args.spawn)]
+        for endpoint in endpoints:
+            servers.append(subprocess.Popen(["redis-server","--port",endpoint.split(":")[1],"--save","","--appendonly","no"],
+                                            stdout=subprocess.DEVNULL))
+        time.sleep(1)
+    else:
+        endpoints = args.endpoints.split(",")
+    try:
+        np.random.seed(args.seed)
+        xmlstring = xmlutils.GenerateTradeEY(0,1)
+        utils.SetPoolOptions(max(16,len(endpoints)*args.readers),20.0,30.0,30)
+        logging.getLogger("utils").setLevel(logging.WARNING) #-- no per block REDISBLOCK lines
+        log.info("%8s %14s %10s" % ("shards","trades/s","speedup"))
+        base = None
+        for n in range(1, len(endpoints)+1):
+            host, _, port = endpoints[0].partition(":")
+            if (n == 1): r = utils.SetupCacheConn("redis",host,int(port or 6379),None,"no")
+            else: r = utils.SetupCacheConn("redis",",".join(endpoints[:n]),6379,None,"no")
+            tradenums = range(args.trades)
+            with r.pipeline() as pipe:
+                for tradenum in tradenums:
+                    pipe.set(utils.TradeKey("eyxml",tradenum), xmlstring)
+                pipe.execute()
+            #-- --readers client threads, each reading its slice of the window
+            def read(slice):
+                for rep in range(args.repeat):
+                    for x in utils.PrefetchTrades(r,"eyxml",slice,args.block): pass
+            readers = [threading.Thread(target=read, args=(tradenums[i::args.readers],)) for i in range(args.readers)]
+            start = time.perf_counter()
+            for reader in readers: reader.start()
+            for reader in readers: reader.join()
+            rate = args.trades * args.repeat / (time.perf_counter() - start)
+            base = base or rate
+            log.info("%8d %14.0f %10.2f" % (n,rate,rate/base))
+    finally:
+        for server in servers: server.terminate()
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser("bench")
+    parser.add_argument('--verbose', default=False, type=lambda x: (str(x).lower() == 'true'), help="verbose output: true or false")
+    parser.add_argument("--seed", default=1, type=int, help="random seed")
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    p = sub.add_parser("barrier", help="coarse time grid / brownian bridge knock out accuracy vs the daily grid")
+    p.add_argument("--trials", default=100000, type=int, help="monte carlo paths per run")
+    p.add_argument("--chunk-size", default=10000, type=int, help="trials simulated at once")
+    p.add_argument("--barrier-distance", default=0.01, type=float, help="strike (knock out level) = fx1 - distance")
+    p.add_argument("--grids", default="86,35,12,4,1", help="comma separated list of coarse grid step counts")
+    p.set_defaults(func=bench_barrier)
+
+    p = sub.add_parser("parse", help="trade parsing: ParseEYXML vs ParseEYXMLFast vs eybin")
+    p.add_argument("--trades", default=2000, type=int, help="trades parsed per parser")
+    p.set_defaults(func=bench_parse)
+
+    p = sub.add_parser("codec", help="payload compression: bytes/trade & cpu/trade per codec and trade format")
+    p.add_argument("--trades", default=2000, type=int, help="trades per format")
+    p.add_argument("--nbytes", default=1000, type=int, help="varxml random CDATA bytes per trade")
+    p.add_argument("--level", default=-1, type=int, help="compression level (-1 = codec default)")
+    p.set_defaults(func=bench_codec)
+
+    p = sub.add_parser("shards", help="read throughput vs number of redis shards (client side sharding)")
+    p.add_argument("--endpoints", default="127.0.0.1:6379", help="comma separated host:port list of running redis instances")
+    p.add_argument("--spawn", default=0, type=int, help="start this many local redis-server processes instead of --endpoints")
+    p.add_argument("--base-port", default=7000, type=int, help="first port of the spawned redis-servers")
+    p.add_argument("--trades", default=100000, type=int, help="trades in the window")
+    p.add_argument("--block", default=1000, type=int, help="trades per MGET")
+    p.add_argument("--repeat", default=5, type=int, help="times the window is read")
+    p.add_argument("--readers", default=4, type=int, help="client threads reading the window")
+    p.set_defaults(func=bench_shards)
+
+    args = parser.parse_args()
+    azlog.setDebug(args.verbose)
+    args.func(args)
@@ -0,0 +1,26 @@
+import os
+import sys
+import pytest
+
+#-- src/secrets.py (key vault access) shadows the standard library module numpy seeds from:
+#-- import the standard one while src is off the path, the tests then import the src modules
+here = os.path.dirname(os.path.abspath(__file__))
+path = sys.path[:]
+sys.path[:] = [p for p in path if os.path.abspath(p or ".") != here]
+import secrets
+sys.path[:] = path
+
+import utils
+
+POOL_DEFAULTS = (utils.pool_size, utils.pool_timeout, utils.socket_timeout, utils.health_check_interval)
+
+@pytest.fixture(autouse=True)
+def cache_defaults():
+    #-- key layout, codec & pool options are module globals of utils: every test starts (and ends) on the defaults
+    utils.SetKeyLayout("flat",1000)
+    utils.SetCodec("none",-1)
+    utils.SetPoolOptions(*POOL_DEFAULTS)
+    yield
+    utils.SetKeyLayout("flat",1000)
+    utils.SetCodec("none",-1)
+    utils.SetPoolOptions(*POOL_DEFAULTS)
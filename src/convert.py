@@ -0,0 +1,62 @@
+#! /usr/bin/env python3
+#
+# convert.py: convert the eyxml trades of a window already in the cache to the eybin format
+#
+import time
+import sys
+
+from config import *
+import config
+import azlog
+import xmlutils
+import utils
+import secrets
+from getargs import getargs
+
+log = azlog.getLogger(__name__)
+
+#-- trades read (one MGET) and written (one pipeline) per round trip
+batchsize=10000
+
+if __name__ == "__main__":
+
+    #-- grab cli args
+    args = getargs("convert")
+
+    #-- verbosity
+    azlog.setDebug(args.verbose)
+
+    #-- pull keys/passwords from the keyvault
+    log.info("Reading keyvault secrets")
+    secrets.ReadKVSecrets()
+    log.info("Done.")
+
+    #-- open connection to cache
+    utils.SetKeyLayout(args.key_layout,args.bucket_size)
+    utils.SetCodec(args.codec,args.codec_level)
+    utils.SetPoolOptions(args.pool_size,args.pool_timeout,args.socket_timeout,args.health_check_interval)
+    r = utils.SetupCacheConn(args.cache_type,args.cache_name,args.cache_port,config.AZFINSIM_REDISKEY,args.cache_ssl,args.cache_path)
+    if r is None:
+        log.error("Cannot connect to Cache DB: %s, %s" % (args.cache_name,args.cache_port))
+        sys.exit(1)
+
+    start_trade=args.start_trade
+    stop_trade=start_trade+args.trade_window
+    tradenums=range(start_trade,stop_trade)
+
+    log.info("Converting trades %d to %d: eyxml -> eybin" % (start_trade,stop_trade-1))
+    start=time.perf_counter()
+    converted=0
+    missing=0
+    pipe = r.pipeline(transaction=False)
+    for tradenum, xmlstring in zip(tradenums, utils.PrefetchTrades(r,"eyxml",tradenums,batchsize)):
+        if xmlstring is None:
+            missing += 1
+            continue
+        pipe.set(utils.TradeKey("eybin",tradenum), utils.Encode(xmlutils.EYXMLToBin(xmlstring,tradenum)))
+        converted += 1
+        if (converted % batchsize == 0): pipe.execute()
+    pipe.execute()
+    end=time.perf_counter()
+    timedelta=end-start
+    log.info("Converted %d trades in %.12f seconds (%d eyxml keys missing)" % (converted,timedelta,missing))
@@ -1,32 +1,111 @@
 #! /usr/bin/env python3
 
 # Dump the cache to dump.txt (used for faster manual injection to skip generation for demos)
+# The trade window (or the keys matching --scan) is read in MGET blocks by a pool of threads and
+# written in order as redis-cli SET lines, a RESP bulk load file or packed eybin records.
 
 import argparse
 import time
 import sys
 import logging
-import pandas as pd
+import numpy as np
+from multiprocessing.pool import ThreadPool
 
 from getargs import getargs
 from config import *
 import config
 import utils
 import xmlutils
-import montecarlo
+import fsstore
 import azlog
 import secrets
 
 log = azlog.getLogger(__name__)
 azlog.color=False
 
+#-- keys read per MGET round trip (and written per output chunk); progress is logged every progress blocks
+blocksize=10000
+progress=10
+
+#-- one output record per trade (None = cannot be written in this format)
+def render_trade(keyname,value):
+    if (dump_format == "eybin"):
+        name, tradenum = fsstore.split_key(keyname)
+        if (name == "eyb.bin"): return bytes(utils.Decode(value))
+        if (name == "ey.xml"):
+            #-- same record as xmlutils.EYXMLToBin(), without the pandas parse
+            trade = xmlutils.ParseEYXMLFast(utils.Decode(value))
+            return np.array([(tradenum,)+tuple(trade[field] for field in xmlutils.EYBIN_DTYPE.names[1:])], xmlutils.EYBIN_DTYPE).tobytes()
+        return None
+    #-- text: redis-cli command line with the decoded trade in a quoted string
+    xmlstring = utils.Decode(value)
+    if keyname.endswith(".bin"):
+        #-- binary record: hex escapes inside the quoted redis-cli string
+        x = "".join("\\x%02x" % c for c in bytes(xmlstring))
+    else:
+        xmlstr = bytes(xmlstring).decode('utf-8')
+        xmlclean = xmlstr.replace("\n","")
+        x = xmlclean.replace('"','\\"')
+    if (args.key_layout == "hash"): line = 'HSET %s %s "%s"\n' % (*utils.BucketKey(keyname),x)
+    else: line = 'SET %s "%s"\n' % (keyname,x)
+    return line.encode()
+
+#-- read one block with a single MGET: returns (output chunk, trades written, missing keys, keys skipped)
+def dump_block(keynames):
+    values = r.mget(keynames)
+    missing = []
+    skipped = 0
+    written = 0
+    if (dump_format == "resp"):
+        #-- the values exactly as stored (codec header included)
+        pipe = utils.RespBuffer(compress)
+        for keyname, value in zip(keynames, values):
+            if value is None:
+                missing.append(keyname)
+                continue
+            pipe.set(keyname,value)
+            written += 1
+        return pipe.chunk(), written, missing, skipped
+    records = []
+    for keyname, value in zip(keynames, values):
+        if value is None:
+            missing.append(keyname)
+            continue
+        record = render_trade(keyname,value)
+        if record is None:
+            skipped += 1
+            continue
+        records.append(record)
+        written += 1
+    return utils.RespCompress(b"".join(records),compress), written, missing, skipped
+
+def window_blocks(start_trade,stop_trade):
+    for first in range(start_trade,stop_trade,blocksize):
+        yield [utils.TradeKey(args.format,tradenum) for tradenum in range(first,min(first+blocksize,stop_trade))]
+
+def scan_blocks(pattern):
+    block = []
+    for keyname in utils.ScanKeys(r,pattern,blocksize):
+        block.append(keyname)
+        if (len(block) == blocksize):
+            yield block
+            block = []
+    if block: yield block
+
 if __name__ == "__main__":
 
     #-- grab cli args
     args = getargs("dumpdb")
 
+    #-- --resp-file is short for --dump-format resp --dump-file <file>
+    if (args.resp_file != "None"):
+        args.dump_format = "resp"
+        args.dump_file = args.resp_file
+    dump_format = args.dump_format
+
     #-- verbosity
     azlog.setDebug(args.verbose)
+    if (args.dump_file == "-"): azlog.setStream(sys.stderr)
 
     #-- pull keys/passwords from the keyvault
     log.info("Reading kevault secrets")
@@ -34,20 +113,65 @@ if __name__ == "__main__":
     log.info("Done.")
 
     #-- open connection to cache
-    r = utils.SetupCacheConn(args.cache_type,args.cache_name,args.cache_port,config.AZFINSIM_REDISKEY,args.cache_ssl)
+    utils.SetKeyLayout(args.key_layout,args.bucket_size)
+    utils.SetCodec(args.codec,args.codec_level)
+    if (args.threads): threads = args.threads
+    else: threads = 4
+    #-- every reader thread gets its own pooled connection
+    utils.SetPoolOptions(max(args.pool_size,threads+1),args.pool_timeout,args.socket_timeout,args.health_check_interval)
+    r = utils.SetupCacheConn(args.cache_type,args.cache_name,args.cache_port,config.AZFINSIM_REDISKEY,args.cache_ssl,args.cache_path,args.seed)
     if r is None:
-             logging.error("Cannot connect to Redis DB: %s, %s, %s" % args.cache_name,args.cache_port,args.cache_key)
+        log.error("Cannot connect to Cache DB: %s, %s" % (args.cache_name,args.cache_port))
+        sys.exit(1)
 
-    f = open("dump.txt", "a")
+    if (args.scan != "None"):
+        if (args.cache_type != "redis" or args.key_layout != "flat"):
+            log.error("--scan needs a redis cache with the flat key layout")
+            sys.exit(1)
+        blocks = scan_blocks(args.scan)
+        total = None
+        log.info("Dumping the keys matching %s (%s)" % (args.scan,dump_format))
+    else:
+        if (dump_format == "eybin" and args.format == "varxml"):
+            log.error("varxml trades have no eybin representation")
+            sys.exit(1)
+        start_trade=args.start_trade
+        stop_trade=start_trade+args.trade_window
+        blocks = window_blocks(start_trade,stop_trade)
+        total = args.trade_window
+        log.info("Dumping trades %d to %d (%s)" % (start_trade,stop_trade-1,dump_format))
 
-    for tradenum in range(0,1000000):
-        keyname = "ey%007d.xml" % tradenum
-	    #-- read trade from cache
-        xmlstring=utils.GetTrade(r,keyname)
-        xmlstr = xmlstring.decode('utf-8')
-        xmlclean = xmlstr.replace("\n","") 
-        x = xmlclean.replace('"','\\"')
-#        log.info("%s %s" % (keyname,xmlstring))
-        str = 'SET %s "%s"' % (keyname,x)
-        print(str, file=f) 
-    f.close()
+    compress = utils.RespCompression(args.dump_file,args.resp_compress)
+    log.info("Writing %s (compression: %s, %d threads, %d keys per MGET)" % (args.dump_file,compress,threads,blocksize))
+    out = utils.OpenResp(args.dump_file)
+
+    start=time.perf_counter()
+    written = 0
+    missing = 0
+    skipped = 0
+    nbytes = 0
+    missing_keys = []
+    with ThreadPool(threads) as pool:
+        #-- imap: blocks are read in parallel but written in order
+        for n, (chunk, block_written, block_missing, block_skipped) in enumerate(pool.imap(dump_block, blocks)):
+            out.write(chunk)
+            nbytes += len(chunk)
+            written += block_written
+            missing += len(block_missing)
+            skipped += block_skipped
+            for keyname in block_missing: log.debug("missing key: %s" % keyname)
+            missing_keys += block_missing[:max(0,10-len(missing_keys))]
+            if (n % progress == progress-1):
+                timedelta = time.perf_counter()-start
+                done = written+missing+skipped
+                log.info("DUMP: %d%s keys, %d missing, %.0f trades/s, %.1f MB/s" %
+                         (done, "/%d" % total if total else "", missing, written/timedelta, nbytes/timedelta/1e6))
+    out.flush()
+    if (args.dump_file != "-"): out.close()
+    end=time.perf_counter()
+    timedelta=end-start
+
+    log.info("Dumped %d trades (%d bytes) in %.12f seconds: %.0f trades/s, %.1f MB/s" %
+             (written,nbytes,timedelta,written/timedelta,nbytes/timedelta/1e6))
+    if (skipped > 0): log.warning("%d keys skipped: no %s representation" % (skipped,dump_format))
+    if (missing > 0): log.warning("%d keys missing, e.g. %s" % (missing,", ".join(missing_keys)))
@@ -0,0 +1,166 @@
+#! /usr/bin/env python3
+#
+# fsstore.py: filesystem cache backend (--cache-type filesystem) - memory mapped packed trade store
+#
+# Keys are the usual cache key names: <prefix><trade number><suffix>, e.g. ey0000042.xml or ey0000042_result.
+# Every prefix/suffix pair gets its own directory under the cache path holding
+#   index.dat     : fixed size records (segment+1, length, offset) at byte offset tradenum*16, 0 = no trade
+#   seg00000.dat  : append only segment files with the packed values, a new one every SEGMENT_SIZE bytes
+# Reads are zero copy memoryview slices of mmap'ed segments; writes from a pipeline are appended in bulk,
+# one write per segment, under an exclusive lock on the index so concurrent writers (threads, processes
+# or nodes sharing an NFS/Azure Files mount) do not interleave.
+#
+import os
+import re
+import mmap
+import fcntl
+import struct
+import threading
+
+import azlog
+
+log = azlog.getLogger(__name__)
+
+SEGMENT_SIZE = 1 << 30
+INDEX_RECORD = struct.Struct('<IIQ')
+KEY_RE = re.compile(r'^([A-Za-z]+)(\d+)(.*)$')
+
+def split_key(key):
+    ''' ey0000042.xml -> ("ey.xml", 42) '''
+    if isinstance(key, bytes): key = key.decode()
+    m = KEY_RE.match(key)
+    if m is None:
+        raise ValueError("filesystem cache: unsupported key name %s (expected <prefix><trade number><suffix>)" % key)
+    return m.group(1) + m.group(3), int(m.group(2))
+
+class Namespace:
+    ''' index & segments of one key prefix/suffix (one directory) '''
+
+    def __init__(self, path, segment_size):
+        self.path = path
+        self.segment_size = segment_size
+        os.makedirs(path, exist_ok=True)
+        self.index_fd = os.open(os.path.join(path, "index.dat"), os.O_RDWR | os.O_CREAT, 0o644)
+        self.index = None
+        self.segments = {}
+
+    def segment_name(self, segment):
+        return os.path.join(self.path, "seg%05d.dat" % segment)
+
+    def index_view(self, tradenum):
+        ''' mmap of the index covering tradenum (remapped as the index grows), or None past its end '''
+        end = (tradenum+1) * INDEX_RECORD.size
+        if self.index is None or len(self.index) < end:
+            size = os.fstat(self.index_fd).st_size
+            if size < end: return None
+            self.index = mmap.mmap(self.index_fd, size, access=mmap.ACCESS_READ)
+        return self.index
+
+    def segment_view(self, segment, end):
+        ''' mmap of a segment covering [0,end): old maps are not closed, slices handed out stay valid '''
+        mm = self.segments.get(segment)
+        if mm is None or len(mm) < end:
+            with open(self.segment_name(segment), "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.segments[segment] = mm
+        return mm
+
+    def get(self, tradenum):
+        index = self.index_view(tradenum)
+        if index is None: return None
+        segment, length, offset = INDEX_RECORD.unpack_from(index, tradenum*INDEX_RECORD.size)
+        if segment == 0: return None
+        mm = self.segment_view(segment-1, offset+length)
+        return memoryview(mm)[offset:offset+length]
+
+    def append(self, items):
+        ''' bulk append [(tradenum, bytes)]: the values are packed into as few segment writes as possible '''
+        fcntl.flock(self.index_fd, fcntl.LOCK_EX)
+        try:
+            segment = 0
+            while os.path.exists(self.segment_name(segment+1)): segment += 1
+            offset = os.path.getsize(self.segment_name(segment)) if os.path.exists(self.segment_name(segment)) else 0
+            records = []
+            chunk = []
+            for tradenum, value in items:
+                if offset > 0 and offset + len(value) > self.segment_size:
+                    self.write_segment(segment, chunk)
+                    segment, offset, chunk = segment+1, 0, []
+                chunk.append(value)
+                records.append((tradenum, segment, len(value), offset))
+                offset += len(value)
+            self.write_segment(segment, chunk)
+            #-- index last: a reader never sees an entry before its data
+            for tradenum, segment, length, offset in records:
+                os.pwrite(self.index_fd, INDEX_RECORD.pack(segment+1, length, offset), tradenum*INDEX_RECORD.size)
+        finally:
+            fcntl.flock(self.index_fd, fcntl.LOCK_UN)
+
+    def write_segment(self, segment, chunk):
+        if not chunk: return
+        with open(self.segment_name(segment), "ab") as f:
+            f.write(b"".join(chunk))
+
+class FileStore:
+    ''' redis-like client (get/mget/set/pipeline) over a packed segment store in a directory '''
+
+    def __init__(self, path, segment_size=SEGMENT_SIZE):
+        self.path = path
+        self.segment_size = segment_size
+        self.namespaces = {}
+        self.lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def namespace(self, name):
+        ns = self.namespaces.get(name)
+        if ns is None:
+            ns = self.namespaces[name] = Namespace(os.path.join(self.path, name), self.segment_size)
+        return ns
+
+    def get(self, key):
+        name, tradenum = split_key(key)
+        with self.lock:
+            return self.namespace(name).get(tradenum)
+
+    def mget(self, keys):
+        return [self.get(key) for key in keys]
+
+    def mset(self, mapping):
+        groups = {}
+        for key, value in mapping.items():
+            name, tradenum = split_key(key)
+            if isinstance(value, str): value = value.encode()
+            groups.setdefault(name, []).append((tradenum, bytes(value)))
+        with self.lock:
+            for name, items in groups.items():
+                self.namespace(name).append(items)
+        return True
+
+    def set(self, key, value):
+        return self.mset({key: value})
+
+    def pipeline(self, transaction=False):
+        return FilePipeline(self)
+
+class FilePipeline:
+    ''' buffers set() calls and appends them in bulk on execute() '''
+
+    def __init__(self, store):
+        self.store = store
+        self.buffer = {}
+
+    def set(self, key, value):
+        self.buffer[key] = value
+        return self
+
+    def execute(self):
+        n = len(self.buffer)
+        if n: self.store.mset(self.buffer)
+        self.buffer = {}
+        return [True] * n
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.buffer = {}
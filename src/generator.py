@@ -7,7 +7,8 @@ import time
 import sys
 import psutil
 import logging
-from multiprocessing.pool import ThreadPool
+import multiprocessing
+import numpy as np
 from azure.identity import DefaultAzureCredential
 
 from config import *
@@ -20,33 +21,49 @@ from getargs import getargs
 
 log = azlog.getLogger(__name__)
 
-#-- todo: fix nbytes for var, and fold these variables into create_trades
 format=""
 tradenum=0
 batchsize=10000
+batchbytes=64<<20       #-- varxml: cap on the payload bytes generated (and pipelined) per batch
+resp_compress=None      #-- --resp-file: RESP chunks are returned to the main process instead of written to the cache
 
-#-- legacy serial method
-def create_trades(tradenum):
-        if (args.format == "eyxml"): 
-            xmlstring = xmlutils.GenerateTradeEY(tradenum,1)
-        elif (format == "varxml"):
-            nbytes=1 #-- TBD need to pass this
-            xmlstring = xmlutils.GenerateTrade(tradenum,nbytes)
-        utils.PutTrade(cache_type,"input",r,format,tradenum,xmlstring)
-
-#-- pipeline / batching method 
-def create_trade_range(start_trade):
-    batchsent=0
-    stop_trade=start_trade+batchsize
-    log.info("Generating batch: %d-%d",start_trade,stop_trade-1)
-    with r.pipeline() as pipe:
-         for tradenum in range (start_trade, stop_trade): 
-             keyname = "ey%007d.xml" % (tradenum)
-             nbytes=1
-             xmlstring = xmlutils.GenerateTradeEY(tradenum,nbytes)
-             pipe.set(keyname,xmlstring) 
-         log.info("Executing batch: %d-%d",start_trade,stop_trade)
-         pipe.execute() 
+#-- where a batch goes: a cache pipeline, or a RESP chunk for the bulk load file
+def trade_sink():
+    if (resp_compress is not None): return utils.RespBuffer(resp_compress)
+    return r.pipeline(transaction=False)
+
+def flush_sink(pipe):
+    if (resp_compress is not None): return pipe.chunk()
+    pipe.execute()
+    return None
+
+#-- bulk method: vectorized batches on a process pool, each worker with its own cache connection
+def init_worker(worker_args,cache_key,worker_resp_compress):
+    global args, r, cache_type, format, resp_compress
+    args = worker_args
+    cache_type = args.cache_type
+    format = args.format
+    resp_compress = worker_resp_compress
+    #-- the utils settings are module globals & the cache key is read from the keyvault in the parent:
+    #-- only a forked worker inherits them (not spawn/forkserver), so they are passed in and set again
+    utils.SetKeyLayout(args.key_layout,args.bucket_size)
+    utils.SetCodec(args.codec,args.codec_level)
+    utils.SetPoolOptions(args.pool_size,args.pool_timeout,args.socket_timeout,args.health_check_interval)
+    if (resp_compress is None): r = utils.SetupCacheConn(args.cache_type,args.cache_name,args.cache_port,cache_key,args.cache_ssl,args.cache_path)
+
+def create_trade_batch(batch):
+    start_trade, stop_trade = batch
+    #-- independent random stream per batch (reproducible with --seed)
+    if (args.seed is None): np.random.seed()
+    else: np.random.seed([args.seed, start_trade])
+    if (format == "eybin"): payloads = xmlutils.GenerateTradesEYBIN(start_trade,stop_trade-start_trade)
+    elif (format == "varxml"): payloads = xmlutils.GenerateTrades(start_trade,stop_trade-start_trade,args.nbytes)
+    else: payloads = xmlutils.GenerateTradesEY(start_trade,stop_trade-start_trade)
+    with trade_sink() as pipe:
+        for tradenum, payload in zip(range(start_trade, stop_trade), payloads):
+            pipe.set(utils.TradeKey(format,tradenum),utils.Encode(payload))
+        log.debug("Generated batch: %d-%d",start_trade,stop_trade-1)
+        return flush_sink(pipe)
 
 if __name__ == "__main__":
 
@@ -55,6 +72,8 @@ if __name__ == "__main__":
 
     #-- verbosity
     azlog.setDebug(args.verbose)
+    #-- RESP to stdout: keep the log off the data stream
+    if (args.resp_file == "-"): azlog.setStream(sys.stderr)
     log.info("Starting trade generator...")
 
     #-- pull keys/passwords from the keyvault
@@ -71,29 +90,46 @@ if __name__ == "__main__":
 
     #-- open connection to cache
     log.info("Setting up cache connection")
-    if (args.cache_type == "redis" or args.cache_type == "hazelcast"):
-        r = utils.SetupCacheConn(args.cache_type,args.cache_name,args.cache_port,config.AZFINSIM_REDISKEY,args.cache_ssl)
+    utils.SetKeyLayout(args.key_layout,args.bucket_size)
+    utils.SetCodec(args.codec,args.codec_level)
+    #-- pools are per process: every pool worker opens its own, and writes one batch pipeline at a time
+    utils.SetPoolOptions(args.pool_size,args.pool_timeout,args.socket_timeout,args.health_check_interval)
+    if (args.resp_file != "None"):
+        #-- bulk load file: no cache connection, the trades go to the file in pipeline order
+        resp_compress = utils.RespCompression(args.resp_file,args.resp_compress)
+        log.info("Writing RESP bulk load file: %s (compression: %s)" % (args.resp_file,resp_compress))
+        out = utils.OpenResp(args.resp_file)
+    elif (args.cache_type == "redis" or args.cache_type == "hazelcast" or args.cache_type == "filesystem"):
+        r = utils.SetupCacheConn(args.cache_type,args.cache_name,args.cache_port,config.AZFINSIM_REDISKEY,args.cache_ssl,args.cache_path)
         if r is None:
              log.error("Cannot connect to Cache DB: %s, %s, %s" % args.cache_name,args.cache_port,args.cache_key,args.cache_ssl)
              sys.exit(1)
     log.info("Done.")
 
-    #nbytes=args.nbytes
     cache_type = args.cache_type
     format = args.format
 
     start_trade=args.start_trade
     stop_trade=start_trade+args.trade_window
 
-    thread_pool = ThreadPool(threads)
-    log.info(f'Starting the thread pool and filling the cache (%d threads)', threads)
+    #-- at least 4 batches per process so that the pool stays balanced on small windows
+    batch = max(1, min(batchsize, args.trade_window // (threads*4)))
+    if (format == "varxml"):
+        #-- large payloads: keep a batch within batchbytes of memory & pipeline
+        batch = max(1, min(batch, batchbytes // max(args.nbytes,1)))
+        log.info(f'varxml payload: %d bytes of CDATA per trade', args.nbytes)
+    batches = [(b, min(b+batch, stop_trade)) for b in range(start_trade, stop_trade, batch)]
+    log.info(f'Starting the process pool and filling the cache (%d processes)', threads)
     log.info(f'Generating %d trades in range %d to %d', args.trade_window,start_trade,stop_trade-1)
-    log.info(f'Batchsize for pipeline to redis: %d',batchsize)
+    log.info(f'Batchsize for pipeline to redis: %d',batch)
     start=time.perf_counter()
-#   thread_pool.map(create_trades, range(start_trade,stop_trade))
-    thread_pool.map(create_trade_range, range(start_trade, stop_trade, batchsize))
+    with multiprocessing.Pool(threads, initializer=init_worker, initargs=(args,config.AZFINSIM_REDISKEY,resp_compress)) as pool:
+        for chunk in pool.imap(create_trade_batch, batches):
+            if chunk is not None: out.write(chunk)
 
+    if (resp_compress is not None): out.flush()
+    if (resp_compress is not None and args.resp_file != "-"): out.close()
     end=time.perf_counter()
     timedelta=end-start
     log.info("Done.")
-    log.info("Cache filled with %d trades in %.12f seconds" % (args.trade_window,timedelta)) 
\ No newline at end of file
+    log.info("Cache filled with %d trades in %.12f seconds (%.0f trades/s)" % (args.trade_window,timedelta,args.trade_window/timedelta)) 
\ No newline at end of file
@@ -4,6 +4,15 @@
 
 import argparse
 
+#-- --grid: daily, weekly or a positive number of time steps
+def grid(value):
+    if (value in ["daily","weekly"]): return value
+    try:
+        if (int(value) > 0): return value
+    except ValueError:
+        pass
+    raise argparse.ArgumentTypeError("expected daily, weekly or a positive number of steps, got '%s'" % value)
+
 def getargs(progname):
 
     parser = argparse.ArgumentParser(progname)
@@ -15,21 +24,53 @@ def getargs(progname):
 
     #-- Cache parameters
     parser.add_argument("--cache-type", default="none", required=True,
-                        choices=['redis','filesystem','none'],
-                        help="cache type: redis|filesystem|none"),
-    parser.add_argument("--cache-name", required=True, default="None", help="<redis or filesystem hostname/ip (port must be open)>")
+                        choices=['redis','filesystem','virtual','none'],
+                        help="cache type: redis|filesystem|virtual (eyxml/eybin trades synthesised on the node from --seed & trade number, results dropped)|none"),
+    parser.add_argument("--cache-name", required=True, default="None", help="<redis or filesystem hostname/ip (port must be open)>; comma separated host[:port] list to shard trades over several redis instances")
     parser.add_argument("--cache-port", default=6380, type=int, help="redis port number: default=6380 [SSL]")
     parser.add_argument("--cache-key", default="None", help="cache access key (pulled from keyvault)")
     parser.add_argument("--cache-ssl", default="yes", choices=['yes','no'], help="use SSL for redis cache access")
-    parser.add_argument("--cache-path", default="None", help="Cache Filesystem Path (not needed for redis")
+    parser.add_argument("--pool-size", default=16, type=int, help="max redis connections per process (shared by all threads)")
+    parser.add_argument("--pool-timeout", default=20.0, type=float, help="seconds to wait for a free pooled connection (0 = fail at once when the pool is exhausted)")
+    parser.add_argument("--socket-timeout", default=30.0, type=float, help="redis socket read/write timeout in seconds")
+    parser.add_argument("--health-check-interval", default=30, type=int, help="ping pooled connections idle longer than this many seconds before reuse")
+    parser.add_argument("--key-layout", default="flat", choices=['flat','hash'], help="redis key layout: flat (one key per trade) | hash (trades grouped into hashes of --bucket-size)")
+    parser.add_argument("--bucket-size", default=1000, type=int, help="hash key layout: trades per hash; sharded caches: trades per shard range (a hash or range is never split over shards)")
+    parser.add_argument("--codec", default="none", choices=['none','zlib','lz4','zstd'], help="compress trade payloads written to the cache (reads detect the codec from the payload header)")
+    parser.add_argument("--codec-level", default=-1, type=int, help="compression level (-1 = codec default)")
+    parser.add_argument("--resp-file", default="None", help="generator/dump: write the trades as a RESP bulk load file for redis-cli --pipe instead of to the cache (- = stdout)")
+    parser.add_argument("--resp-compress", default="auto", choices=['auto','none','gzip','zstd'], help="RESP file compression: auto (from the .gz/.zst suffix)|none|gzip|zstd")
+    parser.add_argument("--dump-format", default="text", choices=['text','resp','eybin'], help="dump: text (redis-cli SET lines)|resp (RESP bulk load)|eybin (packed binary trade records)")
+    parser.add_argument("--dump-file", default="dump.txt", help="dump: output file, compressed when it ends in .gz/.zst (- = stdout)")
+    parser.add_argument("--scan", default="None", help="dump: the keys matching this pattern (redis SCAN, e.g. 'ey*.xml') instead of the trade window")
+    parser.add_argument("--cache-path", default="None", help="Cache Filesystem Path for --cache-type filesystem (not needed for redis)")
 
     #-- algorithm/work per thread
     parser.add_argument("--tasks", default=0, type=int, help="tasks to run on the compute pool (batch tasks)")
     parser.add_argument('--harvester', default=False, type=lambda x: (str(x).lower() == 'true'), help="use harvester scheduler: true or false")
-    parser.add_argument("-f", "--format", default="varxml", choices=['varxml','eyxml'],help="format of trade data: varxml|eyxml")
+    parser.add_argument("-f", "--format", default="varxml", choices=['varxml','eyxml','eybin'],help="format of trade data: varxml|eyxml|eybin (fixed layout binary EY record)")
+    parser.add_argument("--nbytes", default=1000, type=int, help="varxml: random CDATA bytes per trade (sets the trade size, KB to MB)")
     parser.add_argument("-s", "--start-trade", default=0, type=int, help="trade range to process: starting trade number")
     parser.add_argument("-w", "--trade-window", required=True, type=int, help="number of trades to process")
-    parser.add_argument("-a", "--algorithm", default="deltavega", choices=['deltavega','pvonly','synthetic'],help="pricing algorithm")
+    parser.add_argument("-a", "--algorithm", default="deltavega", choices=['deltavega','pvonly','synthetic','pathwise','likelihood','stress'],help="pricing algorithm (pathwise: lowest noise greeks, but without the knock out term they are biased for trades near the barrier - a warning is logged; likelihood: unbiased, noisier; stress: no pricing, write each trade read back to the cache to measure cache bandwidth)")
+    parser.add_argument("--kernel", default="loop", choices=['loop','vector','stream'], help="monte carlo kernel: loop (reference) | vector (numpy) | stream (constant memory)")
+    parser.add_argument("--risk-engine", default="bump", choices=['bump','crn'], help="deltavega engine: bump (reprice per bump) | crn (single pass, common random numbers)")
+    parser.add_argument('--compare-fd', default=False, type=lambda x: (str(x).lower() == 'true'), help="pathwise/likelihood: also compute finite difference greeks for comparison: true or false")
+    parser.add_argument("--batch-size", default=1, type=int, help="pvonly/deltavega: price this many trades per vectorized call (1 = one trade at a time); needs --kernel stream (and --risk-engine crn for deltavega)")
+    parser.add_argument("--workers", default=1, type=int, help="price the trade window on a pool of this many processes (1 = in process)")
+    parser.add_argument("--prefetch", default=0, type=int, help="read trades from the cache in blocks of this many keys (MGET) ahead of pricing (0 = one GET per trade)")
+    parser.add_argument('--pipeline', default=False, type=lambda x: (str(x).lower() == 'true'), help="overlap cache reads, pricing & cache writes in separate stages: true or false")
+    parser.add_argument("--queue-depth", default=16, type=int, help="pipeline: trades buffered between stages (and max trades per write batch)")
+    parser.add_argument("--write-batch", default=64, type=int, help="results buffered per pipelined write back to the cache")
+    parser.add_argument("--write-interval", default=10.0, type=float, help="also flush buffered results when this many seconds have passed since the last write (0 = off)")
+    parser.add_argument("--seed", default=None, type=lambda x: None if str(x) == "None" else int(x), help="job seed: each trade gets a reproducible random stream from (seed, trade number); default: unseeded")
+    parser.add_argument("--variance", default="none", choices=['none','antithetic','control','sobol'], help="PV variance reduction: none|antithetic|control (lognormal control variate)|sobol (scrambled quasi random)")
+    parser.add_argument("--target-stderr", default=0.0, type=float, help="adaptive paths: stop once the PV standard error is below this (0 = off)")
+    parser.add_argument("--target-rel-stderr", default=0.0, type=float, help="adaptive paths: stop once stderr/|PV| is below this (0 = off)")
+    parser.add_argument("--max-trials", default=0, type=int, help="adaptive paths: path budget per trade (0 = the trade's trials)")
+    parser.add_argument("--barrier", default="discrete", choices=['discrete','bridge'], help="knock out monitoring: discrete (grid points only) | bridge (brownian bridge crossing correction)")
+    parser.add_argument("--grid", default="daily", type=grid, help="simulation time grid: daily|weekly|<number of steps>")
+    parser.add_argument("--chunk-size", default=10000, type=int, help="trials simulated at once by the stream kernel (and per adaptive increment)")
 
     #-- synthetic workload options
     parser.add_argument("-d", "--delay-start", type=int, default=0, help="delay startup time in seconds")
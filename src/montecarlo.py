@@ -4,15 +4,96 @@ import numpy as np
 #from scipy.interpolate import interp2d, interp1d
 from datetime import date
 import time
+import math
 import logging
 from applicationinsights import TelemetryClient
 from applicationinsights.logging import LoggingHandler
 
+import azlog
 import xmlutils
 
+log = azlog.getLogger(__name__)
+
 #-- Montecarlo
 
-def mc_simulation(fx1, sigma1, drift, v, ro, maturity, t_steps, trials):
+#-- default number of trials held in memory at once by the streaming kernel
+CHUNK_SIZE = 10000
+#-- normal draws generated per block when using per-trade random streams
+RNG_BLOCK = 1 << 20
+#-- independently scrambled replicates used for the sobol standard error
+SOBOL_REPLICATES = 8
+#-- pathwise greeks: warn when more than this share of the PV sits on paths whose minimum is within
+#-- BARRIER_BAND (relative) above the knock out level, where the missing crossing term is large
+PATHWISE_BARRIER_SHARE = 0.01
+BARRIER_BAND = 0.01
+
+def trade_seed(seed, tradenum):
+    ''' independent, reproducible random stream for one trade of a job '''
+    return np.random.SeedSequence([seed, tradenum])
+
+def normal_steps(rng, chunk, noise, t_steps, method="pseudo"):
+    ''' yields (random_num_2, random_num_1) of shape noise for each time step of one chunk of trials.
+        rng = None: draws from the global numpy generator one step at a time (legacy, not reproducible)
+        rng = SeedSequence (or one per batch element, for noise = batch_shape + ... + (n,)): draws from a
+              PCG64 stream keyed by (trade seed, chunk), filled a block of steps at a time. The answer
+              only depends on the seed and the chunk size, so chunks can be simulated anywhere.
+        method = "pseudo" | "antithetic": trials 2k and 2k+1 get opposite draws |
+                 "sobol": scrambled sobol points (one per trial, one dimension per draw) '''
+    if (method == "antithetic"):
+        n = noise[-1]
+        for half_2, half_1 in normal_steps(rng, chunk, noise[:-1] + ((n + 1)//2,), t_steps):
+            random_num_2 = np.empty(noise, np.float64)
+            random_num_1 = np.empty(noise, np.float64)
+            random_num_2[..., 0::2], random_num_2[..., 1::2] = half_2, -half_2[..., :n//2]
+            random_num_1[..., 0::2], random_num_1[..., 1::2] = half_1, -half_1[..., :n//2]
+            yield random_num_2, random_num_1
+        return
+
+    if (method == "sobol"):
+        from scipy.stats import norm, qmc
+        if rng is None:
+            seeds = [np.random.randint(2**31)]
+        else:
+            seeds = [rng] if isinstance(rng, np.random.SeedSequence) else list(rng)
+            seeds = [np.random.Generator(np.random.PCG64(np.random.SeedSequence(s.entropy, spawn_key=s.spawn_key + (chunk,))))
+                     for s in seeds]
+        n = noise[-1]
+        #-- FX shocks take the first (best distributed) t_steps dimensions, vol shocks the rest
+        z = np.empty((len(seeds), n, 2 * t_steps), np.float64)
+        for i, seed in enumerate(seeds):
+            z[i] = norm.ppf(qmc.Sobol(d=2 * t_steps, scramble=True, seed=seed).random(n))
+        for t in range(t_steps):
+            yield z[:, :, t_steps + t].reshape(noise), z[:, :, t].reshape(noise)
+        return
+
+    if rng is None:
+        for t in range(t_steps):
+            yield np.random.standard_normal(noise), np.random.standard_normal(noise)
+        return
+
+    seeds = [rng] if isinstance(rng, np.random.SeedSequence) else list(rng)
+    gens = [np.random.Generator(np.random.PCG64(np.random.SeedSequence(s.entropy, spawn_key=s.spawn_key + (chunk,))))
+            for s in seeds]
+    n = noise[-1]
+    block = max(1, min(t_steps, RNG_BLOCK // (2 * n * len(gens))))
+    for t0 in range(0, t_steps, block):
+        nblk = min(block, t_steps - t0)
+        z = np.empty((len(gens), nblk, 2, n), np.float64)
+        for i, gen in enumerate(gens):
+            gen.standard_normal(out=z[i])
+        for t in range(nblk):
+            yield z[:, t, 0].reshape(noise), z[:, t, 1].reshape(noise)
+
+def grid_steps(grid, t_steps):
+    ''' time steps to simulate for a --grid setting: daily (the trade's own t_steps, returned as 0),
+        weekly (one step per 5 business days) or an explicit number of steps '''
+    if (grid == "daily"):
+        return 0
+    if (grid == "weekly"):
+        return int(math.ceil(t_steps / 5))
+    return int(grid)
+
+def mc_simulation(fx1, sigma1, drift, v, ro, maturity, t_steps, trials, rng=None):
 
     dt = float(maturity) / t_steps  # defining time step
     ndt = np.zeros((t_steps + 1, trials), np.float64)    # place holder array for time step counter
@@ -27,11 +108,12 @@ def mc_simulation(fx1, sigma1, drift, v, ro, maturity, t_steps, trials):
     # loc_vol = np.zeros((t_steps + 1, trials), np.float64)  # place holder array for simulated local volatility
     # loc_vol[0] = 1  # setting local volatility value at t = 0
 
+    draws = normal_steps(rng, 0, (trials,), t_steps)
     for t in range(1, t_steps+1):
         ndt[t] = ndt[t - 1] + dt  # counting time steps
 
-        random_num_2 = np.random.standard_normal(trials)  # drawing random numbers for stochastic volatility process
-        random_num_1 = np.random.standard_normal(trials)  # drawing random numbers for FX process
+        # drawing random numbers for stochastic volatility process (2) and FX process (1)
+        random_num_2, random_num_1 = next(draws)
 
         stoh_vol[t] = stoh_vol[t-1] * np.exp((-0.5 * v ** 2) * dt + v * (ro * random_num_1 + np.sqrt(1-ro ** 2) *
         random_num_2) * np.sqrt(dt))   # stochastic volatility process
@@ -42,7 +124,194 @@ def mc_simulation(fx1, sigma1, drift, v, ro, maturity, t_steps, trials):
 
     return fx_simulation, stoh_vol, ndt
 
-def price_option(inputs):
+def mc_stream(fx1, sigma1, drift, v, ro, maturity, t_steps, trials, chunk_size=CHUNK_SIZE, greeks=False, batch_shape=(),
+              rng=None, method="pseudo", control=False, first_chunk=0, bridge=None):
+    ''' streaming version of mc_simulation: advances only the current spot/vol state and tracks
+        the running minimum of each path for the knock out. Trials are simulated chunk_size at
+        a time, so peak memory depends on the chunk size and not on t_steps.
+        returns (settlement fx, minimum fx) per trial (and per scenario if given arrays)
+        batch_shape = leading dimensions of the parameters (e.g. trades) that get independent
+        random numbers; any remaining dimensions (scenarios) share them
+        rng = random stream(s) for normal_steps(): one per batch element, or None for the global generator
+        greeks=True also returns, per trial, the pathwise derivative d log(fx_T)/d sigma1 and the
+        likelihood ratio scores d log(density)/d fx1 and d log(density)/d sigma1
+        method = random numbers used, see normal_steps()
+        control=True also returns (after any greeks) the settlement fx of a constant vol (sigma1)
+        lognormal path driven by the same FX shocks, as a control variate
+        first_chunk = index of the first chunk's random stream, to continue an earlier simulation
+        bridge = barrier level: also returns (last) the brownian bridge probability that each path stayed
+        above it between the grid points, for a continuously monitored knock out on a coarse grid '''
+
+    #-- parameters may be arrays of scenarios: each scenario gets a row of trials and
+    #-- all rows are driven by the same random numbers (common random numbers)
+    fx1, sigma1, drift, v, ro = [np.asarray(p, np.float64)[..., np.newaxis] for p in (fx1, sigma1, drift, v, ro)]
+    shape = np.broadcast_shapes(fx1.shape, sigma1.shape, drift.shape, v.shape, ro.shape)[:-1]
+    if bridge is not None:
+        bridge = np.asarray(bridge, np.float64)[..., np.newaxis]
+    batch_shape = tuple(batch_shape)
+
+    dt = float(maturity) / t_steps  # defining time step
+    settlementRate = np.zeros(shape + (trials,), np.float64)
+    fxMin = np.zeros(shape + (trials,), np.float64)
+    if greeks:
+        dlogFx = np.zeros(shape + (trials,), np.float64)
+        scoreFx1 = np.zeros(shape + (trials,), np.float64)
+        scoreSigma1 = np.zeros(shape + (trials,), np.float64)
+    if control:
+        fxControl = np.zeros(shape + (trials,), np.float64)
+    if bridge is not None:
+        survival = np.zeros(shape + (trials,), np.float64)
+
+    for lo in range(0, trials, chunk_size):
+        hi = min(lo + chunk_size, trials)
+        n = hi - lo
+        noise = batch_shape + (1,) * (len(shape) - len(batch_shape)) + (n,)
+
+        stoh_vol = np.broadcast_to(sigma1, shape + (n,)).copy()  # volatility state at t = 0
+        fx = np.broadcast_to(fx1, shape + (n,)).copy()  # FX state at t = 0
+        fxmin = fx.copy()
+        if greeks:
+            dlogfx = np.zeros_like(fx)
+            scoresigma = np.zeros_like(fx)
+        if control:
+            sumz1 = np.zeros(noise, np.float64)
+        if bridge is not None:
+            alive = np.ones_like(fx)
+            logfx = np.log(fx / bridge)  # log distance to the barrier
+
+        draws = normal_steps(rng, first_chunk + lo // chunk_size, noise, t_steps, method)
+        for t in range(1, t_steps+1):
+            # drawing random numbers for stochastic volatility process (2) and FX process (1)
+            random_num_2, random_num_1 = next(draws)
+
+            #-- same update as mc_simulation, applied in place to the current state only
+            stoh_vol *= np.exp((-0.5 * v ** 2) * dt + v * (ro * random_num_1 + np.sqrt(1-ro ** 2) *
+            random_num_2) * np.sqrt(dt))
+            fx *= np.exp((drift - 0.5 * stoh_vol ** 2) * dt + stoh_vol * random_num_1 * np.sqrt(dt))
+            np.minimum(fxmin, fx, out=fxmin)
+            if control:
+                sumz1 += random_num_1
+            if bridge is not None:
+                #-- P(bridge dips below the barrier | both ends above) = exp(-2 x0 x1 / (vol^2 dt)); 1 if either end is below
+                lastfx, logfx = logfx, np.log(fx / bridge)
+                alive *= 1 - np.exp(-2 * np.maximum(lastfx, 0) * np.maximum(logfx, 0) / (stoh_vol ** 2 * dt))
+
+            if greeks:
+                #-- vol paths scale with sigma1, so d stoh_vol/d sigma1 = stoh_vol/sigma1
+                dlogfx += (stoh_vol * random_num_1 * np.sqrt(dt) - stoh_vol ** 2 * dt) / sigma1
+                #-- given the vol driver w, the FX shock is N(ro*w, 1-ro^2): u is its standardised residual
+                w = ro * random_num_1 + np.sqrt(1-ro ** 2) * random_num_2
+                u = (random_num_1 - ro * w) / np.sqrt(1-ro ** 2)
+                scoresigma += (u ** 2 - 1 + u * (ro * w - stoh_vol * np.sqrt(dt)) / np.sqrt(1-ro ** 2)) / sigma1
+                if (t == 1):
+                    #-- fx1 only enters the density of the first FX step
+                    scoreFx1[..., lo:hi] = u / (np.sqrt(1-ro ** 2) * stoh_vol * np.sqrt(dt) * fx1)
+
+        settlementRate[..., lo:hi] = fx
+        fxMin[..., lo:hi] = fxmin
+        if greeks:
+            dlogFx[..., lo:hi] = dlogfx
+            scoreSigma1[..., lo:hi] = scoresigma
+        if control:
+            fxControl[..., lo:hi] = fx1 * np.exp((drift - 0.5 * sigma1 ** 2) * dt * t_steps + sigma1 * np.sqrt(dt) * sumz1)
+        if bridge is not None:
+            survival[..., lo:hi] = alive
+
+    out = (settlementRate, fxMin)
+    if greeks:
+        out += (dlogFx, scoreFx1, scoreSigma1)
+    if control:
+        out += (fxControl,)
+    if bridge is not None:
+        out += (survival,)
+    return out
+
+def net_settlement(settlementRate, fxMin, strike, warrantsNo, notionalPerWarr, barrier=None, survival=None):
+    ''' vectorized cash settlement / knock out / net settlement over all trials:
+        settlementRate = final simulated FX per trial, fxMin = path minimum per trial
+        barrier = knock out level (default: the strike), survival = probability per trial of not
+        having been knocked out between the grid points (brownian bridge) '''
+    cashSetAm = warrantsNo * notionalPerWarr * np.maximum(0, (settlementRate / strike) - 1) * (1 / settlementRate)
+    if barrier is None:
+        barrier = strike
+    if survival is not None:
+        cashSetAm = cashSetAm * survival
+    #-- knocked out if any EURGBP value in the path is below the strike
+    return np.where(fxMin < barrier, 0, cashSetAm * 1.000799081)
+
+def lognormal_payoff_mean(fx1, sigma1, drift, maturity, strike):
+    ''' closed form E[max(0, 1/strike - 1/fx_T)] for lognormal fx_T with constant vol sigma1:
+        the unbarriered cash settlement per unit notional '''
+    mu = -(math.log(fx1) + (drift - 0.5 * sigma1 ** 2) * maturity)  # 1/fx_T is lognormal too
+    s = sigma1 * math.sqrt(maturity)
+    d = (math.log(1 / strike) - mu) / s
+    return (1 / strike) * 0.5 * math.erfc(-d / math.sqrt(2)) - math.exp(mu + 0.5 * s ** 2) * 0.5 * math.erfc(-(d - s) / math.sqrt(2))
+
+def pv_stderr(netSettlement, variance="none", control=None, controlMean=None, replicates=SOBOL_REPLICATES):
+    ''' PV estimate and its standard error for each variance reduction mode '''
+    if (variance == "antithetic"):
+        #-- (z, -z) pairs are correlated: the pair averages are the independent samples
+        samples = netSettlement[:len(netSettlement)//2*2].reshape(-1, 2).mean(axis=1)
+    elif (variance == "sobol"):
+        #-- quasi random points are not independent: use the spread of the scrambled replicates
+        samples = netSettlement.reshape(replicates, -1).mean(axis=1)
+    elif (variance == "control"):
+        cov = np.cov(netSettlement, control)
+        b = cov[0, 1] / cov[1, 1] if cov[1, 1] > 0 else 0
+        samples = netSettlement - b * (control - controlMean)
+    else:
+        samples = netSettlement
+    return samples.mean(), samples.std(ddof=1) / np.sqrt(len(samples))
+
+def sobol_replicate_size(trials, replicates=SOBOL_REPLICATES):
+    ''' points per scrambled sobol replicate: the smallest power of two with replicates x points >= trials '''
+    return 2 ** int(math.ceil(math.log2(max(-(-trials // replicates), 1))))
+
+def knockout_levels(strike, sigma1, maturity, t_steps, barrier="discrete"):
+    ''' (knock out level, brownian bridge level or None) for a barrier mode, see stream_settlements():
+        the bridge barrier is shifted down (Broadie-Glasserman-Kou) to match daily monitoring '''
+    if (barrier == "bridge"):
+        level = strike * np.exp(-0.5826 * np.asarray(sigma1) * math.sqrt(float(maturity) / t_steps))
+        return level, level
+    return strike, None
+
+def stream_settlements(inputs, paths, chunk_size, rng=None, variance="none", first_chunk=0, barrier="discrete", nsteps=0):
+    ''' net settlement per path from the stream kernel for a variance reduction mode,
+        plus the control variate samples and their expectation for variance="control"
+        nsteps = time steps to simulate (0 = the trade's daily t_steps, see grid_steps())
+        barrier = "discrete": knock out checked at the grid points only |
+                  "bridge": brownian bridge crossing probability between grid points against a barrier
+                  shifted (Broadie-Glasserman-Kou) to match the trade's daily monitoring '''
+    fx1 = inputs['fx1']
+    sigma1 = inputs['sigma1']
+    drift = inputs['drift']
+    maturity = inputs['maturity']
+    warrantsNo = inputs['warrantsNo']
+    notionalPerWarr = inputs['notionalPerWarr']
+    strike = inputs['strike']
+    t_steps = inputs['t_steps']
+
+    barrierLevel, bridge = knockout_levels(strike, sigma1, maturity, t_steps, barrier)
+    survival = None
+    out = mc_stream(fx1, sigma1, drift, inputs['v'], inputs['ro'], maturity, nsteps if nsteps > 0 else t_steps,
+                    paths, chunk_size, rng=rng, method=variance if variance in ["antithetic","sobol"] else "pseudo",
+                    control=(variance == "control"), first_chunk=first_chunk, bridge=bridge)
+    if bridge is not None:
+        survival = out[-1]
+    netSettlement = net_settlement(out[0], out[1], strike, warrantsNo, notionalPerWarr, barrierLevel, survival)
+    control, controlMean = None, None
+    if (variance == "control"):
+        #-- unbarriered payoff of the constant vol path and its closed form expectation
+        control = warrantsNo * notionalPerWarr * 1.000799081 * np.maximum(0, 1 / strike - 1 / out[2])
+        controlMean = warrantsNo * notionalPerWarr * 1.000799081 * lognormal_payoff_mean(fx1, sigma1, drift, maturity, strike)
+    return netSettlement, control, controlMean
+
+def price_option(inputs, kernel="loop", chunk_size=CHUNK_SIZE, rng=None, variance="none", barrier="discrete", nsteps=0):
+    ''' returns [PV, PV_time, standard error, paths simulated]
+        variance = none | antithetic | control | sobol, barrier/nsteps: see stream_settlements()
+        (any of these other than the defaults use the stream kernel)
+        variance = "sobol" simulates SOBOL_REPLICATES scrambled replicates of 2^k points each, the
+        smallest 2^k that covers the trade's trials: e.g. 8 x 2048 = 16384 paths for 10000 trials '''
 
     #print("price_option")
     #print(inputs)
@@ -68,8 +337,28 @@ def price_option(inputs):
     strike = inputs['strike']
     
     ''' Monte Carlo Model'''
-    Simulation = mc_simulation(fx1, sigma1, drift, v, ro, maturity, t_steps, trials)  # calling the MC function
+    if (kernel == "stream" or variance != "none" or barrier != "discrete" or nsteps > 0):
+        #-- constant memory kernel: no path matrices at all
+        paths = trials
+        if (variance == "sobol"):
+            #-- each chunk is one scrambled replicate of 2^k points, rounded up to cover the trade's trials
+            chunk_size = sobol_replicate_size(trials)
+            paths = chunk_size * SOBOL_REPLICATES
+        elif (variance == "antithetic"):
+            chunk_size += chunk_size % 2  # keep (z, -z) pairs inside a chunk
+
+        netSettlement, control, controlMean = stream_settlements(inputs, paths, chunk_size, rng, variance, 0, barrier, nsteps)
+        PV, stderr = pv_stderr(netSettlement, variance, control, controlMean)
+        return [PV, (time.time() - start_time), stderr, paths]
+
+    Simulation = mc_simulation(fx1, sigma1, drift, v, ro, maturity, t_steps, trials, rng)  # calling the MC function
     #print(Simulation)
+
+    if (kernel == "vector"):
+        #-- numpy kernel: same PV as the loops below, without the dataframe round trip
+        fxPaths = Simulation[0]
+        netSettlement = net_settlement(fxPaths[t_steps], fxPaths.min(axis=0), strike, warrantsNo, notionalPerWarr)
+        return [netSettlement.mean(), (time.time() - start_time)] + list(pv_stderr(netSettlement)[1:]) + [trials]
     
     '''
     ============================================
@@ -145,15 +434,203 @@ def price_option(inputs):
             netSettlement[i] = cashSetAm[i] * 1.000799081
     
      #netSettlement netSettlement[i] = (cashSetAm[i] - warrantsPrice) * np.exp(-drift * delta.days / 365)= Cash Settlement(t0) - Warrant Price(t0)
-    return [netSettlement.mean(), (time.time() - start_time)]
+    return [netSettlement.mean(), (time.time() - start_time)] + list(pv_stderr(netSettlement)[1:]) + [trials]
+
+def price_adaptive(inputs, tol=0.0, rel_tol=0.0, max_paths=0, chunk_size=CHUNK_SIZE, rng=None, variance="none",
+                   barrier="discrete", nsteps=0):
+    ''' stream kernel PV that simulates chunk_size paths at a time and stops as soon as the standard
+        error is <= tol (absolute) or <= rel_tol * |PV|, or max_paths (default: the trade's trials)
+        have been used. Easy trades (deep out of the money, certain knock out) stop after one chunk.
+        variance = "sobol": chunks are whole replicates of 2^k <= min(chunk_size, max_paths/2) points
+        and a partial last replicate is never simulated, so fewer than max_paths paths may be used.
+        returns [PV, PV_time, standard error, paths simulated] like price_option() '''
 
-def risk(parameter, inputs, alpha = 0.01):
+    start_time = time.time()
+    if (max_paths <= 0):
+        max_paths = inputs['trials']
+    if (variance == "sobol"):
+        #-- each chunk is one whole scrambled replicate of 2^k points, and the budget must hold at least two
+        chunk_size = 2 ** int(np.log2(max(min(chunk_size, max_paths // 2), 1)))
+    elif (variance == "antithetic"):
+        chunk_size += chunk_size % 2
+
+    netSettlement, control = np.zeros(0), np.zeros(0)
+    chunk = 0
+    while True:
+        n = min(chunk_size, max_paths - len(netSettlement))
+        settlements, controls, controlMean = stream_settlements(inputs, n, chunk_size, rng, variance, chunk, barrier, nsteps)
+        netSettlement = np.concatenate([netSettlement, settlements])
+        if controls is not None:
+            control = np.concatenate([control, controls])
+        chunk += 1
+
+        if (variance == "sobol"):
+            #-- only whole replicates are simulated: stop when the next one does not fit in the budget
+            full = len(netSettlement) + chunk_size > max_paths
+            if (chunk < 2 and not full):
+                continue  # need two replicates for an error estimate
+            PV, stderr = pv_stderr(netSettlement, variance, replicates=chunk)
+        else:
+            PV, stderr = pv_stderr(netSettlement, variance, control, controlMean)
+            full = len(netSettlement) >= max_paths
+
+        if (stderr <= tol or stderr <= rel_tol * abs(PV) or full):
+            return [PV, (time.time() - start_time), stderr, len(netSettlement)]
+
+def risk(parameter, inputs, alpha = 0.01, kernel="loop", chunk_size=CHUNK_SIZE, rng=None, barrier="discrete", nsteps=0):
 
     delta = inputs[parameter]*alpha
     inputs[parameter] += delta
-    PV_up = price_option(inputs)[0]
+    PV_up = price_option(inputs, kernel, chunk_size, rng, barrier=barrier, nsteps=nsteps)[0]
     inputs[parameter] -= 2*delta
-    PV_down = price_option(inputs)[0]
+    PV_down = price_option(inputs, kernel, chunk_size, rng, barrier=barrier, nsteps=nsteps)[0]
     inputs[parameter] += delta
     sensi = (PV_up - PV_down)/2/delta/10000
     return sensi
+
+def crn_scenarios(fx1, sigma1, alpha, barrier="discrete"):
+    ''' bump scenarios simulated together by risk_crn()/price_portfolio(), along a new last axis:
+        base, sigma1 up, sigma1 down and, for barrier = "bridge", fx1 up, fx1 down (the bridge
+        survival probability is not linear in fx1, so those paths cannot be rescaled) '''
+    fx1, sigma1 = np.asarray(fx1, np.float64)[..., np.newaxis], np.asarray(sigma1, np.float64)[..., np.newaxis]
+    if (barrier == "bridge"):
+        return fx1 * (1 + alpha*np.array([0, 0, 0, 1, -1])), sigma1 * (1 + alpha*np.array([0, 1, -1, 0, 0]))
+    return fx1, sigma1 * (1 + alpha*np.array([0, 1, -1]))
+
+def risk_crn(inputs, alpha = 0.01, chunk_size=CHUNK_SIZE, rng=None, barrier="discrete", nsteps=0):
+    ''' PV, Delta & Vega in a single streaming pass: the base case and the sigma1 up/down
+        scenarios share one set of random numbers. FX paths are linear in fx1, so the fx1
+        up/down scenarios are the base paths rescaled and need no extra simulation
+        (except with the brownian bridge, see crn_scenarios()). barrier/nsteps: see stream_settlements()
+        returns [PV, PV_time, Delta, Vega, PV standard error, paths simulated] with the same
+        bump/scaling as risk() '''
+
+    start_time = time.time()
+    fx1 = inputs['fx1']
+    sigma1 = inputs['sigma1']
+    strike = inputs['strike']
+    warrantsNo = inputs['warrantsNo']
+    notionalPerWarr = inputs['notionalPerWarr']
+
+    dfx = fx1*alpha
+    dsigma = sigma1*alpha
+    fx1s, sigmas = crn_scenarios(fx1, sigma1, alpha, barrier)
+    barrierLevel, bridge = knockout_levels(strike, sigmas, inputs['maturity'], inputs['t_steps'], barrier)
+    out = mc_stream(fx1s, sigmas, inputs['drift'], inputs['v'], inputs['ro'], inputs['maturity'],
+                    nsteps if nsteps > 0 else inputs['t_steps'], inputs['trials'], chunk_size, rng=rng, bridge=bridge)
+    settlementRate, fxMin = out[:2]
+    barrierLevel = np.broadcast_to(barrierLevel, sigmas.shape)
+
+    def settlements(row, scale=1.0):
+        return net_settlement(settlementRate[row]*scale, fxMin[row]*scale, strike, warrantsNo, notionalPerWarr,
+                              barrierLevel[row], None if bridge is None else out[-1][row])
+
+    def pv(row, scale=1.0):
+        return settlements(row, scale).mean()
+
+    PV, stderr = pv_stderr(settlements(0))
+    if (bridge is None):
+        delta = (pv(0, (fx1 + dfx)/fx1) - pv(0, (fx1 - dfx)/fx1))/2/dfx/10000
+    else:
+        delta = (pv(3) - pv(4))/2/dfx/10000
+    vega = (pv(1) - pv(2))/2/dsigma/10000
+    return [PV, (time.time() - start_time), delta, vega, stderr, settlementRate.shape[-1]]
+
+def risk_analytic(inputs, method="pathwise", chunk_size=CHUNK_SIZE, rng=None, nsteps=0):
+    ''' PV, Delta & Vega from a single simulation, with no bump size to choose:
+        method = "pathwise": derivative of the payoff along each path. Lowest noise, but it does
+                 not see the knock out boundary moving, so it omits the barrier crossing term:
+                 a warning is logged when that term is likely to matter (see PATHWISE_BARRIER_SHARE).
+        method = "likelihood": payoff times the score of the path density. Unbiased including the
+                 knock out, but noisier.
+        nsteps: see stream_settlements() (the knock out is discrete: there is no brownian bridge term)
+        returns [PV, PV_time, Delta, Vega, PV standard error, paths simulated] scaled like risk() '''
+
+    start_time = time.time()
+    fx1 = inputs['fx1']
+    strike = inputs['strike']
+    warrantsNo = inputs['warrantsNo']
+    notionalPerWarr = inputs['notionalPerWarr']
+
+    settlementRate, fxMin, dlogFx, scoreFx1, scoreSigma1 = mc_stream(fx1, inputs['sigma1'], inputs['drift'], inputs['v'],
+        inputs['ro'], inputs['maturity'], nsteps if nsteps > 0 else inputs['t_steps'], inputs['trials'], chunk_size,
+        greeks=True, rng=rng)
+    netSettlement = net_settlement(settlementRate, fxMin, strike, warrantsNo, notionalPerWarr)
+
+    if (method == "likelihood"):
+        delta = (netSettlement * scoreFx1).mean()/10000
+        vega = (netSettlement * scoreSigma1).mean()/10000
+    else:
+        #-- d netSettlement / d settlementRate = c/fx^2 in the money and alive; d fx_T = fx_T * d log(fx_T)
+        alive = (fxMin >= strike) & (settlementRate > strike)
+        dPayoff = np.where(alive, warrantsNo * notionalPerWarr * 1.000799081 / settlementRate, 0)
+        delta = (dPayoff / fx1).mean()/10000
+        vega = (dPayoff * dlogFx).mean()/10000
+        #-- paths alive with their minimum just above the barrier are the ones a bump would knock out
+        near = alive & (fxMin < strike * (1 + BARRIER_BAND))
+        share = netSettlement[near].sum() / max(netSettlement.sum(), 1e-300)
+        if (share > PATHWISE_BARRIER_SHARE):
+            log.warning("pathwise greeks omit the knock out term: %.1f%% of the PV is on paths within %.0f%% of the barrier "
+                        "(Delta/Vega biased, use --algorithm likelihood or deltavega)" % (100*share, 100*BARRIER_BAND))
+
+    return [netSettlement.mean(), (time.time() - start_time), delta, vega] + list(pv_stderr(netSettlement)[1:]) + [len(netSettlement)]
+
+def price_portfolio(trades, greeks=True, alpha = 0.01, chunk_size=CHUNK_SIZE, rng=None, barrier="discrete", grid="daily"):
+    ''' vectorized pricing of a batch of trades: trades is the dataframe from ParseEYXML, or a
+        dict of equal length arrays with the same columns. Trades sharing maturity/t_steps/trials
+        are simulated together as one trades x trials array, each trade with its own random
+        numbers, so memory is ~ (#trades x 3 scenarios x chunk_size) doubles per state array.
+        greeks=True adds Delta/Vega with the single pass bumps of risk_crn().
+        rng = list of per-trade random streams (trade_seed()), in trade order: each trade then gets
+        exactly the same answer as when priced alone with risk_crn()
+        barrier: see stream_settlements(), grid = daily|weekly|<steps>: see grid_steps()
+        returns [PV, PV_time, Delta, Vega, PV standard error, paths simulated]: arrays in trade
+        order (Delta/Vega are NaN without greeks) and the elapsed time for the whole batch '''
+
+    start_time = time.time()
+    cols = {k: np.asarray(trades[k]) for k in ['fx1','drift','maturity','t_steps','trials','ro','v','sigma1',
+                                              'warrantsNo','notionalPerWarr','strike']}
+    ntrades = len(cols['fx1'])
+    PV = np.zeros(ntrades)
+    Delta = np.full(ntrades, np.nan)
+    Vega = np.full(ntrades, np.nan)
+    StdErr = np.zeros(ntrades)
+    Paths = np.zeros(ntrades, dtype=np.int64)
+
+    groups = pd.DataFrame({k: cols[k] for k in ['maturity','t_steps','trials']})
+    for (maturity, t_steps, trials), idx in groups.groupby(['maturity','t_steps','trials']).indices.items():
+        #-- one row per trade, one column per scenario (see crn_scenarios())
+        fx1, sigma1, drift, v, ro, warrantsNo, notionalPerWarr, strike = [cols[k][idx, np.newaxis].astype(np.float64)
+            for k in ['fx1','sigma1','drift','v','ro','warrantsNo','notionalPerWarr','strike']]
+        dsigma = sigma1*alpha
+        if greeks:
+            fx1s, sigmas = crn_scenarios(fx1[:, 0], sigma1[:, 0], alpha, barrier)
+        else:
+            fx1s, sigmas = fx1, sigma1
+        barrierLevel, bridge = knockout_levels(strike, sigmas, maturity, int(t_steps), barrier)
+        nsteps = grid_steps(grid, int(t_steps))
+        out = mc_stream(fx1s, sigmas, drift, v, ro, maturity, nsteps if nsteps > 0 else int(t_steps), int(trials),
+                        chunk_size, batch_shape=(len(idx),), rng=None if rng is None else [rng[i] for i in idx], bridge=bridge)
+        settlementRate, fxMin = out[:2]
+        barrierLevel = np.broadcast_to(barrierLevel, sigmas.shape)
+
+        def settlements(col, scale=1.0):
+            return net_settlement(settlementRate[:, col]*scale, fxMin[:, col]*scale, strike, warrantsNo, notionalPerWarr,
+                                  barrierLevel[:, col, np.newaxis], None if bridge is None else out[-1][:, col])
+
+        def pv(col, scale=1.0):
+            return settlements(col, scale).mean(axis=1)
+
+        base = settlements(0)
+        PV[idx] = base.mean(axis=1)
+        StdErr[idx] = base.std(axis=1, ddof=1) / np.sqrt(base.shape[1])
+        Paths[idx] = base.shape[1]
+        if greeks:
+            dfx = fx1*alpha
+            if (bridge is None):
+                Delta[idx] = ((pv(0, (fx1 + dfx)/fx1) - pv(0, (fx1 - dfx)/fx1))/2/dfx[:, 0]/10000)
+            else:
+                Delta[idx] = ((pv(3) - pv(4))/2/dfx[:, 0]/10000)
+            Vega[idx] = ((pv(1) - pv(2))/2/dsigma[:, 0]/10000)
+
+    return [PV, (time.time() - start_time), Delta, Vega, StdErr, Paths]
@@ -85,9 +85,17 @@ if __name__ == '__main__':
         taskname = "task_{:06d}".format(idx)
         command = ('/bin/sh -c "%s \
 --start-trade %d --trade-window %d --tasks %d --task-duration %d \
---cache-type %s --cache-name %s --cache-port %s --cache-key %s --cache-ssl %s \
---appinsights-key %s --format %s --algorithm %s --failure %f"') \
-        % (ENGINE,start_trade,tradespertask,args.tasks,args.task_duration,args.cache_type,args.cache_name,args.cache_port,config.AZFINSIM_REDISKEY,args.cache_ssl,config.APP_INSIGHTS_INSTRUMENTATION_KEY,args.format,args.algorithm,args.failure)
+--cache-type %s --cache-name %s --cache-port %s --cache-key %s --cache-ssl %s --cache-path %s --codec %s --codec-level %d --key-layout %s --bucket-size %d \
+--pool-size %d --pool-timeout %f --socket-timeout %f --health-check-interval %d \
+--appinsights-key %s --format %s --algorithm %s --failure %f \
+--kernel %s --chunk-size %d --risk-engine %s --compare-fd %s --batch-size %d --seed %s --variance %s \
+--workers %d --prefetch %d --pipeline %s --queue-depth %d --write-batch %d --write-interval %f \
+--target-stderr %f --target-rel-stderr %f --max-trials %d --barrier %s --grid %s"') \
+        % (ENGINE,start_trade,tradespertask,args.tasks,args.task_duration,args.cache_type,args.cache_name,args.cache_port,config.AZFINSIM_REDISKEY,args.cache_ssl,args.cache_path,args.codec,args.codec_level,args.key_layout,args.bucket_size,
+           args.pool_size,args.pool_timeout,args.socket_timeout,args.health_check_interval,config.APP_INSIGHTS_INSTRUMENTATION_KEY,args.format,args.algorithm,args.failure,
+           args.kernel,args.chunk_size,args.risk_engine,args.compare_fd,args.batch_size,args.seed,args.variance,
+           args.workers,args.prefetch,args.pipeline,args.queue_depth,args.write_batch,args.write_interval,
+           args.target_stderr,args.target_rel_stderr,args.max_trials,args.barrier,args.grid)
         start_trade += tradespertask
 
         destination_path = f"{pool_id}/{job_id}/{taskname}"
@@ -0,0 +1,70 @@
+#! /usr/bin/env python3
+
+# Checks for the azfinsim pricing driver: python -m pytest -q
+
+import argparse
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+import azfinsim
+import utils
+import xmlutils
+from getargs import getargs
+
+def make_args(**kwargs):
+    args = dict(cache_type="virtual", cache_name="None", cache_port=6380, cache_key="None", cache_ssl="no",
+                cache_path="None", seed=7, appinsights_key="None", key_layout="flat", bucket_size=1000,
+                codec="none", codec_level=-1, pool_size=16, pool_timeout=20.0, socket_timeout=30.0,
+                health_check_interval=30)
+    args.update(kwargs)
+    return argparse.Namespace(**args)
+
+#-- --workers: a spawned (not forked) worker starts from the utils defaults and must set everything up itself
+def test_init_worker_applies_cache_settings():
+    azfinsim.init_worker(make_args(key_layout="hash", bucket_size=250, codec="zlib", codec_level=3, pool_size=5, pool_timeout=1.5))
+    assert (utils.key_layout, utils.bucket_size) == ("hash", 250)
+    assert (utils.codec, utils.codec_level) == ("zlib", 3)
+    assert (utils.pool_size, utils.pool_timeout) == (5, 1.5)
+    assert azfinsim.worker['r'].get(utils.TradeKey("eyxml", 3)) == utils.VirtualCache(7).get(utils.TradeKey("eyxml", 3))
+
+class NullTelemetry:
+    def track_metric(self, name, value): pass
+    def flush(self): pass
+
+def window_args(monkeypatch, *argv):
+    monkeypatch.setattr(sys, "argv", ["azfinsim", "--cache-type", "virtual", "--cache-name", "None", "--format", "eyxml",
+                                      "--seed", "7", "--trade-window", "7",
+                                      "--algorithm", "pvonly", "--kernel", "stream", *argv])
+    return getargs("azfinsim")
+
+#-- --pipeline: the fetch / price / write stages price the window exactly as the serial loop does
+def test_pipeline_matches_serial(monkeypatch):
+    args = window_args(monkeypatch, "--pipeline", "true", "--prefetch", "3", "--queue-depth", "2")
+    r = utils.SetupCacheConn(args.cache_type,args.cache_name,args.cache_port,args.cache_key,args.cache_ssl,args.cache_path,args.seed)
+    tc = NullTelemetry()
+    columns = ['PV','PV_time', 'Delta', 'Vega', 'StdErr', 'Paths', 'Compute', 'Label']
+    results = pd.DataFrame(columns = columns)
+    azfinsim.price_pipeline(args, r, tc, utils.ResultWriter(args.cache_type,r,args.format,args.write_batch,args.write_interval,tc), results, 0, 7)
+    serial = pd.DataFrame(columns = columns)
+    for tradenum in range(7):
+        res, xmlstring = azfinsim.price_trade(args, r, tc, tradenum)
+        for k in res: serial.loc[tradenum, k] = res[k]
+    assert list(results.index) == list(range(7))
+    np.testing.assert_array_equal(results['PV'].astype(float), serial['PV'].astype(float))
+
+#-- --algorithm stress: each trade read is written back at full size, read & write timed separately
+@pytest.mark.parametrize("prefetch", [0, 2])
+def test_stress_writes_trades_back(monkeypatch, prefetch):
+    fakeredis = pytest.importorskip("fakeredis")
+    args = window_args(monkeypatch, "--format", "varxml", "--algorithm", "stress", "--codec", "zlib")
+    utils.SetCodec(args.codec,args.codec_level)
+    r = fakeredis.FakeRedis()
+    payloads = xmlutils.GenerateTrades(0,3,5000,np.random.RandomState(1))
+    for tradenum, payload in enumerate(payloads): r.set(utils.TradeKey("varxml",tradenum), utils.Encode(payload))
+    reader = utils.PrefetchTrades(r,args.format,range(3),prefetch,copy=True,timed=True) if prefetch else None
+    for tradenum, payload in enumerate(payloads):
+        res, xmlstring = azfinsim.price_trade(args, r, NullTelemetry(), tradenum, reader)
+        assert res['Bytes'] == len(payload) and res['ReadTime'] >= 0 and res['WriteTime'] >= 0
+        assert utils.Decode(r.get(utils.StressKey("varxml",tradenum))) == payload
@@ -0,0 +1,79 @@
+#! /usr/bin/env python3
+
+# Checks for the filesystem cache backend: python -m pytest -q
+
+import multiprocessing
+import os
+import pytest
+
+import fsstore
+
+def value(tradenum, n=20):
+    return (b"trade %07d " % tradenum).ljust(n, b".")
+
+#-- get/mget/set and pipelined sets read back the same bytes (keys of several namespaces side by side)
+def test_round_trip(tmp_path):
+    store = fsstore.FileStore(str(tmp_path))
+    store.set("ey0000003.xml", value(3))
+    store.set("ey0000001.xml", "<trade 1/>")
+    with store.pipeline(transaction=False) as pipe:
+        for tradenum in range(4, 8): pipe.set("ey%007d.xml" % tradenum, value(tradenum))
+        assert pipe.execute() == [True] * 4
+    store.set("ey0000003_result", b"result 3")
+    assert bytes(store.get("ey0000003.xml")) == value(3)
+    assert bytes(store.get(b"ey0000001.xml")) == b"<trade 1/>"
+    assert [bytes(v) for v in store.mget(["ey%007d.xml" % tradenum for tradenum in range(4, 8)])] == [value(tradenum) for tradenum in range(4, 8)]
+    assert bytes(store.get("ey0000003_result")) == b"result 3"
+    #-- a fresh client (another process or node) sees the same store
+    assert bytes(fsstore.FileStore(str(tmp_path)).get("ey0000006.xml")) == value(6)
+
+#-- a key written again reads back its latest value, values read before stay valid
+def test_overwrite(tmp_path):
+    store = fsstore.FileStore(str(tmp_path))
+    store.set("ey0000002.xml", b"first")
+    before = store.get("ey0000002.xml")
+    store.set("ey0000002.xml", b"second, longer value")
+    assert bytes(store.get("ey0000002.xml")) == b"second, longer value"
+    assert bytes(fsstore.FileStore(str(tmp_path)).get("ey0000002.xml")) == b"second, longer value"
+    assert bytes(before) == b"first"
+
+#-- missing keys: never written, beyond the index, or in a namespace that does not exist yet
+def test_missing_key(tmp_path):
+    store = fsstore.FileStore(str(tmp_path))
+    store.set("ey0000005.xml", value(5))
+    assert store.get("ey0000002.xml") is None
+    assert store.get("ey0001000.xml") is None
+    assert store.get("ey0000005_result") is None
+    assert store.mget(["ey0000004.xml", "ey0000005.xml"])[0] is None
+    with pytest.raises(ValueError):
+        store.get("no_trade_number")
+
+#-- a new segment file is started once a segment would grow past segment_size
+def test_segment_rollover(tmp_path):
+    store = fsstore.FileStore(str(tmp_path), segment_size=64)
+    store.mset({"ey%007d.xml" % tradenum: value(tradenum) for tradenum in range(10)})
+    for tradenum in range(10, 13): store.set("ey%007d.xml" % tradenum, value(tradenum))
+    store.set("ey0000013.xml", value(13, 100))    #-- larger than a segment: gets one of its own
+    segments = sorted(name for name in os.listdir(str(tmp_path / "ey.xml")) if name.startswith("seg"))
+    assert len(segments) > 1
+    assert all(os.path.getsize(str(tmp_path / "ey.xml" / name)) <= 64 for name in segments[:-1])
+    assert [bytes(v) for v in store.mget(["ey%007d.xml" % tradenum for tradenum in range(13)])] == [value(tradenum) for tradenum in range(13)]
+    assert bytes(store.get("ey0000013.xml")) == value(13, 100)
+    assert [bytes(v) for v in fsstore.FileStore(str(tmp_path), segment_size=64).mget(["ey%007d.xml" % tradenum for tradenum in range(14)])] == \
+           [value(tradenum) for tradenum in range(13)] + [value(13, 100)]
+
+def append_trades(path, first, n):
+    store = fsstore.FileStore(path, segment_size=4096)
+    for tradenum in range(first, first+n):
+        store.set("ey%007d.xml" % tradenum, value(tradenum, 30 + tradenum % 7))
+
+#-- writers in several processes appending to the same namespace (and segments) do not interleave
+def test_concurrent_appends(tmp_path):
+    ctx = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn")
+    procs = [ctx.Process(target=append_trades, args=(str(tmp_path), first, 500)) for first in range(0, 2000, 500)]
+    for p in procs: p.start()
+    for p in procs: p.join()
+    assert [p.exitcode for p in procs] == [0] * 4
+    store = fsstore.FileStore(str(tmp_path), segment_size=4096)
+    assert [bytes(v) for v in store.mget(["ey%007d.xml" % tradenum for tradenum in range(2000)])] == \
+           [value(tradenum, 30 + tradenum % 7) for tradenum in range(2000)]
@@ -0,0 +1,76 @@
+#! /usr/bin/env python3
+
+# Checks for the bulk trade generator: python -m pytest -q
+
+import os
+import re
+import types
+import pytest
+
+import utils
+
+SEED = 7
+
+@pytest.fixture
+def generator(monkeypatch):
+    pytest.importorskip("azure.identity")
+    pytest.importorskip("azure.keyvault.secrets")
+    #-- config.py reads the deployment settings from the environment at import
+    for name in re.findall(r"os.environ\['(\w+)'\]", open(os.path.join(os.path.dirname(__file__),"config.py")).read()):
+        monkeypatch.setenv(name, os.environ.get(name, "test"))
+    import generator
+    return generator
+
+def make_args(**kwargs):
+    args = dict(format="eyxml", seed=SEED, nbytes=1000, cache_type="redis", cache_name="cache.test", cache_port=6380,
+                cache_ssl="no", cache_path="None", start_trade=0, key_layout="flat", bucket_size=1000,
+                codec="none", codec_level=-1, pool_size=16, pool_timeout=20.0, socket_timeout=30.0, health_check_interval=30)
+    args.update(kwargs)
+    return types.SimpleNamespace(**args)
+
+#-- a spawned (not forked) pool worker starts from the utils defaults and without the keyvault secrets:
+#-- the settings & the cache key come in through the initializer, the pool is sized per process
+def test_init_worker_applies_cache_settings(generator, monkeypatch):
+    monkeypatch.setattr(utils, "pools", {})
+    generator.init_worker(make_args(key_layout="hash", bucket_size=100, codec="zlib", codec_level=3, pool_size=4), "key from the parent", None)
+    assert (utils.key_layout, utils.bucket_size) == ("hash", 100)
+    assert (utils.codec, utils.codec_level) == ("zlib", 3)
+    assert isinstance(generator.r, utils.BucketedCache)
+    pool = generator.r.connection_pool
+    assert pool.connection_kwargs['password'] == "key from the parent"
+    assert pool.max_connections == 4
+
+#-- the worker's batches are written with the job's key layout & codec
+def test_batch_uses_cache_settings(generator):
+    generator.init_worker(make_args(key_layout="hash", bucket_size=100, codec="zlib", codec_level=3), None, "none")
+    chunk = generator.create_trade_batch((0, 150))
+    assert chunk.count(b"HSET") == 150
+    assert chunk.count(b"ey.xml:00000") == 100 and chunk.count(b"ey.xml:00001") == 50
+    assert chunk.count(utils.CODEC_MAGIC + utils.CODEC_IDS["zlib"]) == 150
+
+#-- RESP bulk load: dump.py of a generated cache writes the generator's --resp-file byte for byte
+#-- (values as stored, codec header included)
+@pytest.mark.parametrize("layout, codec", [("flat", "none"), ("hash", "none"), ("hash", "zlib")])
+def test_resp_dump_matches_generator(generator, layout, codec, monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    import dump
+    args = make_args(key_layout=layout, bucket_size=100, codec=codec)
+    batches = [(0,150), (150,300)]
+    generator.init_worker(args, None, "none")
+    resp = b"".join(generator.create_trade_batch(batch) for batch in batches)
+
+    r = fakeredis.FakeRedis()
+    if (layout == "hash"): r = utils.BucketedCache(r)
+    monkeypatch.setattr(generator, "resp_compress", None)
+    monkeypatch.setattr(generator, "r", r, raising=False)
+    for batch in batches: generator.create_trade_batch(batch)
+
+    monkeypatch.setattr(dump, "args", args, raising=False)
+    monkeypatch.setattr(dump, "r", r, raising=False)
+    monkeypatch.setattr(dump, "dump_format", "resp", raising=False)
+    monkeypatch.setattr(dump, "compress", "none", raising=False)
+    monkeypatch.setattr(dump, "blocksize", 120)
+    blocks = list(dump.window_blocks(0,300))
+    chunks = [dump.dump_block(block) for block in blocks]
+    assert [(written, missing, skipped) for chunk, written, missing, skipped in chunks] == [(len(block), [], 0) for block in blocks]
+    assert b"".join(chunk for chunk, written, missing, skipped in chunks) == resp
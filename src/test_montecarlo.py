@@ -0,0 +1,179 @@
+#! /usr/bin/env python3
+
+# Equality & golden value checks for the pricing kernels and risk engines: python -m pytest -q
+
+import argparse
+import numpy as np
+import pandas as pd
+import pytest
+
+import getargs
+import montecarlo
+import xmlutils
+
+SEED = 7
+
+#-- small deterministic trades: the generator's distributions, fewer trials so the loop kernel stays quick
+def make_trades(N=4, trials=2000):
+    trades = [xmlutils.ParseEYXMLFast(xmlstring) for xmlstring in xmlutils.GenerateTradesEY(0,N,np.random.RandomState(3))]
+    for trade in trades: trade['trials'] = trials
+    return trades
+
+#-- kernels: one chunk covering all trials draws the same random numbers in every kernel
+def test_vector_matches_loop():
+    trade = make_trades()[0]
+    loop = montecarlo.price_option(dict(trade), "loop", trade['trials'], montecarlo.trade_seed(SEED,0))
+    vector = montecarlo.price_option(dict(trade), "vector", trade['trials'], montecarlo.trade_seed(SEED,0))
+    np.testing.assert_allclose(vector[0], loop[0], rtol=1e-12)
+    np.testing.assert_allclose(vector[2], loop[2], rtol=1e-12)
+    assert loop[3] == vector[3] == trade['trials']
+
+def test_stream_matches_vector():
+    trade = make_trades()[0]
+    vector = montecarlo.price_option(dict(trade), "vector", trade['trials'], montecarlo.trade_seed(SEED,0))
+    stream = montecarlo.price_option(dict(trade), "stream", trade['trials'], montecarlo.trade_seed(SEED,0))
+    np.testing.assert_allclose(stream[0], vector[0], rtol=1e-12)
+    np.testing.assert_allclose(stream[2], vector[2], rtol=1e-12)
+    assert stream[3] == trade['trials']
+
+def test_stream_golden_pv():
+    #-- several chunks per trade: each chunk has its own random stream
+    trades = make_trades()
+    pvs = [montecarlo.price_option(dict(trade), "stream", 1000, montecarlo.trade_seed(SEED,i))[0] for i, trade in enumerate(trades)]
+    np.testing.assert_allclose(pvs, GOLDEN_PV, rtol=1e-9)
+
+#-- PVs of make_trades() priced with the stream kernel, 1000 path chunks, seed SEED
+GOLDEN_PV = [13566949.897655254, 8634897.735691376, 10449391.733684395, 4375396.744197876]
+
+#-- risk engines: single pass crn greeks are bump & reprice on common random numbers
+def test_risk_crn_matches_bump():
+    trade = make_trades()[1]
+    rng = montecarlo.trade_seed(SEED,1)
+    crn = montecarlo.risk_crn(dict(trade), chunk_size=1000, rng=rng)
+    pv = montecarlo.price_option(dict(trade), "stream", 1000, rng)
+    np.testing.assert_allclose(crn[0], pv[0], rtol=1e-12)
+    np.testing.assert_allclose(crn[2], montecarlo.risk('fx1', dict(trade), kernel="stream", chunk_size=1000, rng=rng), rtol=1e-9)
+    np.testing.assert_allclose(crn[3], montecarlo.risk('sigma1', dict(trade), kernel="stream", chunk_size=1000, rng=rng), rtol=1e-9)
+    np.testing.assert_allclose(crn[4], pv[2], rtol=1e-12)
+    assert crn[5] == pv[3] == trade['trials']
+
+#-- single simulation greeks: same paths (so the same PV) as the stream kernel
+def test_risk_analytic_pv():
+    trade = make_trades()[2]
+    rng = montecarlo.trade_seed(SEED,2)
+    pv = montecarlo.price_option(dict(trade), "stream", 1000, rng)
+    for method in ["pathwise","likelihood"]:
+        out = montecarlo.risk_analytic(dict(trade), method, 1000, rng)
+        np.testing.assert_allclose(out[0], pv[0], rtol=1e-12)
+        np.testing.assert_allclose(out[4], pv[2], rtol=1e-12)
+
+def test_pathwise_warns_near_barrier(caplog):
+    trade = make_trades()[0]
+    montecarlo.risk_analytic(dict(trade), "pathwise", 1000, montecarlo.trade_seed(SEED,0))
+    assert "knock out term" not in caplog.text
+    #-- barrier 2 big figures below spot: the pathwise Delta misses a large part of the crn Delta
+    trade['strike'] = trade['fx1'] - 0.02
+    pathwise = montecarlo.risk_analytic(dict(trade), "pathwise", 1000, montecarlo.trade_seed(SEED,0))
+    crn = montecarlo.risk_crn(dict(trade), chunk_size=1000, rng=montecarlo.trade_seed(SEED,0))
+    assert pathwise[2] < 0.8 * crn[2]
+    assert "knock out term" in caplog.text
+
+#-- batch pricing: each trade of the batch gets its risk_crn() answer
+def test_price_portfolio_matches_risk_crn():
+    trades = make_trades(6)
+    trades[4]['trials'] = 1500   #-- a second (maturity, t_steps, trials) group
+    rngs = [montecarlo.trade_seed(SEED,i) for i in range(len(trades))]
+    out = montecarlo.price_portfolio(pd.DataFrame(trades), True, chunk_size=1000, rng=rngs)
+    for i, trade in enumerate(trades):
+        crn = montecarlo.risk_crn(dict(trade), chunk_size=1000, rng=rngs[i])
+        np.testing.assert_allclose([out[0][i], out[2][i], out[3][i], out[4][i]], [crn[0], crn[2], crn[3], crn[4]], rtol=1e-9)
+        assert out[5][i] == crn[5]
+
+def test_price_portfolio_pv_only():
+    trades = make_trades()
+    rngs = [montecarlo.trade_seed(SEED,i) for i in range(len(trades))]
+    out = montecarlo.price_portfolio(pd.DataFrame(trades), False, chunk_size=1000, rng=rngs)
+    np.testing.assert_allclose(out[0], GOLDEN_PV, rtol=1e-9)
+    assert np.isnan(out[2]).all() and np.isnan(out[3]).all()
+
+#-- per trade random streams: reproducible with a seed, independent across trades & unseeded runs
+def test_seeded_runs_reproduce():
+    trade = make_trades()[0]
+    first = montecarlo.price_option(dict(trade), "stream", 1000, montecarlo.trade_seed(SEED,0))
+    assert first[0] == montecarlo.price_option(dict(trade), "stream", 1000, montecarlo.trade_seed(SEED,0))[0]
+    assert first[0] != montecarlo.price_option(dict(trade), "stream", 1000, montecarlo.trade_seed(SEED,1))[0]
+    assert first[0] != montecarlo.price_option(dict(trade), "stream", 1000, montecarlo.trade_seed(SEED+1,0))[0]
+
+def test_unseeded_runs_differ():
+    trade = make_trades()[0]
+    assert montecarlo.price_option(dict(trade), "stream", 1000)[0] != montecarlo.price_option(dict(trade), "stream", 1000)[0]
+
+#-- variance reduction: same PV within its error bars, smaller standard error
+@pytest.mark.parametrize("variance", ["antithetic","control","sobol"])
+def test_variance_reduction(variance):
+    trade = make_trades()[0]
+    plain = montecarlo.price_option(dict(trade), "stream", 1000, montecarlo.trade_seed(SEED,0))
+    reduced = montecarlo.price_option(dict(trade), "stream", 1000, montecarlo.trade_seed(SEED,0), variance)
+    assert abs(reduced[0] - plain[0]) < 3 * plain[2]
+    assert reduced[2] < plain[2] / 5
+
+def test_sobol_paths_cover_trials():
+    assert [montecarlo.sobol_replicate_size(trials) for trials in [1, 7, 8, 9, 2000, 10000]] == [1, 1, 1, 2, 256, 2048]
+    trade = make_trades(trials=10000)[0]
+    assert montecarlo.price_option(dict(trade), "stream", 1000, montecarlo.trade_seed(SEED,0), "sobol")[3] == 16384
+
+#-- adaptive paths: the loop over whole sobol replicates reproduces the fixed replicate count
+def test_adaptive_sobol_matches_fixed():
+    trade = make_trades(trials=10000)[0]
+    size = montecarlo.sobol_replicate_size(trade['trials'])
+    fixed = montecarlo.price_option(dict(trade), "stream", 1000, montecarlo.trade_seed(SEED,0), "sobol")
+    adaptive = montecarlo.price_adaptive(dict(trade), 0.0, 0.0, size*montecarlo.SOBOL_REPLICATES, size,
+                                         montecarlo.trade_seed(SEED,0), "sobol")
+    assert fixed[3] == adaptive[3] == size*montecarlo.SOBOL_REPLICATES
+    np.testing.assert_allclose(adaptive[0], fixed[0], rtol=1e-12)
+    np.testing.assert_allclose(adaptive[2], fixed[2], rtol=1e-12)
+
+@pytest.mark.parametrize("chunk_size", [16384, 10000, 8192, 1000])
+def test_adaptive_sobol_budget(chunk_size):
+    trade = make_trades()[0]
+    out = montecarlo.price_adaptive(dict(trade), 0.0, 0.0, 10000, chunk_size, montecarlo.trade_seed(SEED,0), "sobol")
+    #-- at least two whole power of two replicates, all inside the budget
+    assert np.isfinite(out[0]) and np.isfinite(out[2])
+    assert out[3] <= 10000
+    replicate = 2 ** int(np.log2(min(chunk_size, 10000 // 2)))
+    assert out[3] % replicate == 0 and out[3] // replicate >= 2
+
+def test_adaptive_stops_at_target():
+    trade = make_trades()[0]
+    assert montecarlo.price_adaptive(dict(trade), 1e12, 0.0, 10000, 1000, montecarlo.trade_seed(SEED,0))[3] == 1000
+    out = montecarlo.price_adaptive(dict(trade), 0.0, 0.0, 2500, 1000, montecarlo.trade_seed(SEED,0))
+    assert out[3] == 2500
+
+#-- coarse grids & brownian bridge: every engine prices the same barrier
+@pytest.mark.parametrize("barrier,nsteps", [("bridge",0), ("bridge",20), ("discrete",20)])
+def test_barrier_grid_crn_matches_bump(barrier, nsteps):
+    trade = make_trades()[1]
+    rng = montecarlo.trade_seed(SEED,1)
+    crn = montecarlo.risk_crn(dict(trade), chunk_size=1000, rng=rng, barrier=barrier, nsteps=nsteps)
+    pv = montecarlo.price_option(dict(trade), "stream", 1000, rng, barrier=barrier, nsteps=nsteps)
+    delta = montecarlo.risk('fx1', dict(trade), kernel="stream", chunk_size=1000, rng=rng, barrier=barrier, nsteps=nsteps)
+    vega = montecarlo.risk('sigma1', dict(trade), kernel="stream", chunk_size=1000, rng=rng, barrier=barrier, nsteps=nsteps)
+    np.testing.assert_allclose([crn[0], crn[2], crn[3]], [pv[0], delta, vega], rtol=1e-9)
+
+def test_barrier_grid_price_portfolio():
+    trades = make_trades()
+    rngs = [montecarlo.trade_seed(SEED,i) for i in range(len(trades))]
+    out = montecarlo.price_portfolio(pd.DataFrame(trades), True, chunk_size=1000, rng=rngs, barrier="bridge", grid="weekly")
+    for i, trade in enumerate(trades):
+        crn = montecarlo.risk_crn(dict(trade), chunk_size=1000, rng=rngs[i], barrier="bridge",
+                                  nsteps=montecarlo.grid_steps("weekly", trade['t_steps']))
+        np.testing.assert_allclose([out[0][i], out[2][i], out[3][i]], [crn[0], crn[2], crn[3]], rtol=1e-9)
+
+def test_grid_argument():
+    assert [getargs.grid(value) for value in ["daily","weekly","20"]] == ["daily","weekly","20"]
+    for value in ["0","-5","fortnightly"]:
+        with pytest.raises(argparse.ArgumentTypeError):
+            getargs.grid(value)
+    assert montecarlo.grid_steps("daily", 172) == 0
+    assert montecarlo.grid_steps("weekly", 172) == 35
+    assert montecarlo.grid_steps("20", 172) == 20
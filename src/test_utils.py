@@ -0,0 +1,197 @@
+#! /usr/bin/env python3
+
+# Checks for the cache access helpers: python -m pytest -q
+
+import sys
+import numpy as np
+import pytest
+
+import utils
+import xmlutils
+
+fakeredis = pytest.importorskip("fakeredis")
+
+def make_cache(tradenums, format="eyxml"):
+    r = fakeredis.FakeRedis()
+    for tradenum in tradenums: r.set(utils.TradeKey(format, tradenum), b"<trade %d/>" % tradenum)
+    return r
+
+#-- --prefetch: blocks of "block" trades (the last one short), one MGET each, trades yielded in order
+def test_prefetch_block_boundaries(caplog):
+    r = make_cache(range(7))
+    with caplog.at_level("INFO", logger="utils"):
+        xmlstrings = list(utils.PrefetchTrades(r, "eyxml", range(7), 3))
+    assert xmlstrings == [b"<trade %d/>" % tradenum for tradenum in range(7)]
+    blocks = [record.getMessage() for record in caplog.records if "REDISBLOCK" in record.getMessage()]
+    assert len(blocks) == 3
+    assert [int(message.split("TRADE")[1].split(":")[0]) for message in blocks] == [0, 3, 6]
+    assert [message.endswith("(block of %d)" % n) for message, n in zip(blocks, [3, 3, 1])] == [True] * 3
+
+#-- a trade missing from the cache comes back as None in its slot, the rest of the block is unaffected
+def test_prefetch_missing_keys():
+    r = make_cache([0, 2, 3])
+    xmlstrings = list(utils.PrefetchTrades(r, "eyxml", range(5), 2))
+    assert xmlstrings == [b"<trade 0/>", None, b"<trade 2/>", b"<trade 3/>", None]
+
+#-- timed: each trade carries its share of the block read; copy: independent bytes (stress writes them back)
+def test_prefetch_timed_copy():
+    r = make_cache(range(4))
+    items = list(utils.PrefetchTrades(r, "eyxml", range(4), 4, copy=True, timed=True))
+    assert [xmlstring for xmlstring, timedelta in items] == [b"<trade %d/>" % tradenum for tradenum in range(4)]
+    assert all(type(xmlstring) is bytes for xmlstring, timedelta in items)
+    assert len(set(timedelta for xmlstring, timedelta in items)) == 1 and items[0][1] >= 0
+
+#-- prefetched values are decoded like GetTrade() reads
+def test_prefetch_decodes():
+    utils.SetCodec("zlib", 6)
+    r = fakeredis.FakeRedis()
+    r.set(utils.TradeKey("eyxml", 0), utils.Encode(b"<trade 0/>"))
+    assert list(utils.PrefetchTrades(r, "eyxml", [0], 8)) == [b"<trade 0/>"]
+
+#-- results: buffered until "batch" trades are queued, then written in one pipelined round trip
+def test_result_writer_flushes_by_batch():
+    r = fakeredis.FakeRedis()
+    writer = utils.ResultWriter("redis", r, "eyxml", batch=3)
+    for tradenum in range(2): writer.add(tradenum, {'PV': tradenum})
+    assert r.get(utils.ResultKey("eyxml", 0)) is None
+    writer.add(2, {'PV': 2})
+    assert all(r.get(utils.ResultKey("eyxml", tradenum)) is not None for tradenum in range(3))
+    writer.add(3, {'PV': 3})
+    assert r.get(utils.ResultKey("eyxml", 3)) is None
+    writer.close()
+    assert r.get(utils.ResultKey("eyxml", 3)) is not None
+
+#-- ... or on the first add() "interval" seconds after the last flush
+def test_result_writer_flushes_by_interval(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(utils.time, "time", lambda: now[0])
+    r = fakeredis.FakeRedis()
+    writer = utils.ResultWriter("redis", r, "eyxml", batch=64, interval=10.0)
+    writer.add(0, {'PV': 0})
+    now[0] += 5.0
+    writer.add(1, {'PV': 1})
+    assert r.get(utils.ResultKey("eyxml", 0)) is None
+    now[0] += 5.0
+    writer.add(2, {'PV': 2})
+    assert all(r.get(utils.ResultKey("eyxml", tradenum)) is not None for tradenum in range(3))
+    now[0] += 5.0
+    writer.add(3, {'PV': 3})
+    assert r.get(utils.ResultKey("eyxml", 3)) is None
+
+#-- each result is one 64 byte RESULT_DTYPE record: missing fields and trades read back as NaN
+def test_get_results_records():
+    r = fakeredis.FakeRedis()
+    writer = utils.ResultWriter("redis", r, "eybin", batch=64)
+    writer.add(5, {'PV': 1.5, 'Delta': -0.25, 'Vega': 3.0, 'StdErr': 0.01, 'Paths': 10000, 'TradeTime': 0.5})
+    writer.add(6, {'PV': 2.5, 'Label': 'ignored'})
+    writer.close()
+    assert utils.RESULT_DTYPE.itemsize == 64
+    assert len(r.get(utils.ResultKey("eybin", 5))) == 64
+    out = utils.GetResults(r, "eybin", [5, 6, 7])
+    assert out.dtype == utils.RESULT_DTYPE
+    assert (out['PV'][0], out['Delta'][0], out['Vega'][0], out['Paths'][0], out['TradeTime'][0]) == (1.5, -0.25, 3.0, 10000.0, 0.5)
+    assert np.isnan(out['PV_time'][0]) and np.isnan(out['Compute'][0])
+    assert out['PV'][1] == 2.5 and np.isnan(out['Delta'][1])
+    assert all(np.isnan(out[2][field]) for field in utils.RESULT_DTYPE.names)
+
+#-- --workers: the workers' pool counters are summed into the parent's, the mean recomputed over all acquires
+def test_add_pool_stats(monkeypatch):
+    monkeypatch.setattr(utils, "pool_stats", {'acquires': 2, 'acquire_time': 0.5, 'exhausted': 0, 'failed': 1})
+    utils.AddPoolStats({'acquires': 6, 'acquire_time': 1.5, 'exhausted': 3, 'failed': 0, 'acquire_mean': 0.25})
+    assert utils.PoolStats() == {'acquires': 8, 'acquire_time': 2.0, 'exhausted': 3, 'failed': 1, 'acquire_mean': 0.25}
+
+#-- payload codecs: every installed codec round trips (str, bytes & zero copy memoryview payloads)
+@pytest.mark.parametrize("name", sorted(utils.CODEC_IDS))
+def test_codec_round_trip(name):
+    if not utils.CodecAvailable(name): pytest.skip("codec %s is not installed" % name)
+    payload = b"<AZFINSIM>" + b"<trade fx1=\"0.87\"/>" * 200 + b"</AZFINSIM>"
+    utils.SetCodec(name, 3)
+    value = utils.Encode(payload)
+    assert value[:4] == utils.CODEC_MAGIC + utils.CODEC_IDS[name] and len(value) < len(payload)
+    assert utils.Decode(value) == payload
+    assert utils.Decode(memoryview(value)) == payload
+    assert utils.Decode(utils.Encode(payload.decode())) == payload
+    utils.SetCodec("none", -1)
+    assert utils.Decode(utils.Encode(payload, name)) == payload
+
+#-- values written without a codec (or by older jobs) have no header and come back as stored, not copied
+def test_codec_legacy_passthrough():
+    assert utils.Encode(b"<trade/>") == b"<trade/>"
+    raw = memoryview(b"<AZFINSIM><trade/></AZFINSIM>")
+    assert utils.Decode(raw) is raw
+    for value in [None, b"", b"\x89A", utils.CODEC_MAGIC + b"?" + b"not compressed"]:
+        assert utils.Decode(value) is value
+
+#-- lz4 & zstd are optional packages: without them the codec is unavailable and --codec fails up front
+@pytest.mark.parametrize("name, modules", [("lz4", ["lz4", "lz4.frame"]), ("zstd", ["zstandard"])])
+def test_codec_missing_package(name, modules, monkeypatch):
+    monkeypatch.setattr(utils, "codec_funcs", {})
+    for module in modules: monkeypatch.setitem(sys.modules, module, None)
+    assert not utils.CodecAvailable(name)
+    with pytest.raises(ImportError):
+        utils.SetCodec(name, -1)
+    assert utils.codec == "none"
+    assert utils.CodecAvailable("zlib")
+
+#-- hash key layout: a trade is field <tradenum> of the bucket_size trades hash <prefix><suffix>:<bucket>
+def test_bucketed_cache():
+    utils.SetKeyLayout("hash", 100)
+    assert utils.BucketKey("ey0000042.xml") == ("ey.xml:00000", "42")
+    assert utils.BucketKey("eyb0012345.bin") == ("eyb.bin:00123", "12345")
+    raw = fakeredis.FakeRedis()
+    r = utils.BucketedCache(raw)
+    keys = [utils.TradeKey("eyxml", tradenum) for tradenum in range(250)]
+    with r.pipeline() as pipe:
+        for key in keys[:240]: pipe.set(key, key.encode())
+        pipe.execute()
+    r.set(keys[245], b"single")
+    assert sorted(raw.keys()) == [b"ey.xml:00000", b"ey.xml:00001", b"ey.xml:00002"]
+    assert raw.hlen("ey.xml:00001") == 100 and raw.hget("ey.xml:00002", "245") == b"single"
+    #-- mget across buckets: values back in key order, missing trades as None
+    assert r.mget(keys[::-1]) == [b"single" if i == 245 else (keys[i].encode() if i < 240 else None) for i in range(249, -1, -1)]
+    assert r.get(keys[17]) == keys[17].encode() and r.get(keys[241]) is None
+    assert list(utils.PrefetchTrades(r, "eyxml", range(95, 105), 4)) == [key.encode() for key in keys[95:105]]
+
+#-- sharding: whole bucket_size ranges per shard on a consistent hash ring, flat or hash layout on the shards
+@pytest.mark.parametrize("layout", ["flat", "hash"])
+def test_sharded_cache(layout):
+    utils.SetKeyLayout(layout, 100)
+    def cache(n):
+        shards = [fakeredis.FakeRedis(server=fakeredis.FakeServer()) for i in range(n)]
+        if (layout == "hash"): shards = [utils.BucketedCache(shard) for shard in shards]
+        return utils.ShardedCache(shards, ["host%d:6379" % i for i in range(n)])
+    r = cache(3)
+    keys = [utils.TradeKey("eyxml", tradenum) for tradenum in range(5000)]
+    with r.pipeline() as pipe:
+        for key in keys: pipe.set(key, key.encode())
+        pipe.execute()
+    assert r.mget(keys) == [key.encode() for key in keys]
+    assert r.get(keys[42]) == keys[42].encode()
+    assert r.shards[r.shard(keys[42])].get(keys[42]) == keys[42].encode()
+    #-- whole ranges per shard, every shard used; a new shard only takes ranges over
+    assert all(len({r.shard(key) for key in keys[first:first+100]}) == 1 for first in range(0, 5000, 100))
+    assert {r.shard(key) for key in keys} == {0, 1, 2}
+    r4 = cache(4)
+    assert all(r4.shard(key) in (r.shard(key), 3) for key in keys)
+    #-- placement depends on the endpoint names only: the same in every process & run
+    assert [cache(3).shard(key) for key in keys[::100]] == [r.shard(key) for key in keys[::100]]
+
+#-- virtual cache: a trade is a function of (seed, trade number) only, whatever the read pattern
+def test_virtual_cache_deterministic():
+    a = utils.VirtualCache(7)
+    b = utils.VirtualCache(7)
+    keys = [utils.TradeKey(format, tradenum) for format in ["eyxml", "eybin"] for tradenum in [0, 1, 12345]]
+    values = [a.get(key) for key in keys]
+    assert values == [b.get(key) for key in keys] == a.mget(keys) == b.mget(keys[::-1])[::-1]
+    assert values == list(utils.PrefetchTrades(a, "eyxml", [0, 1, 12345], 2)) + list(utils.PrefetchTrades(a, "eybin", [0, 1, 12345], 2))
+    assert values != [utils.VirtualCache(8).get(key) for key in keys]
+    assert len(set(values)) == len(values)
+    assert xmlutils.ParseEYXMLFast(a.get(utils.TradeKey("eyxml", 1)))['trials'] == 10000
+    assert xmlutils.ParseEYBIN(a.get(utils.TradeKey("eybin", 12345)))['fx1'] > 0
+    #-- writes are dropped, varxml has no synthetic form
+    a.set(keys[0], b"written")
+    with a.pipeline() as pipe:
+        pipe.set(keys[1], b"written")
+        assert pipe.execute() == []
+    assert a.get(keys[0]) == values[0] and a.get(keys[1]) == values[1]
+    assert a.get(utils.TradeKey("varxml", 0)) is None
@@ -0,0 +1,94 @@
+#! /usr/bin/env python3
+
+# Checks for the trade generators & parsers: python -m pytest -q
+
+import re
+import numpy as np
+import pandas as pd
+import pytest
+
+import xmlutils
+
+#-- eybin: one fixed 100 byte record per trade, carrying the trade number
+def test_eybin_record_layout():
+    records = xmlutils.GenerateTradesEYBIN(42,3,np.random.RandomState(1))
+    assert xmlutils.EYBIN_DTYPE.itemsize == 100
+    assert [len(record) for record in records] == [100] * 3
+    assert [int(np.frombuffer(record, xmlutils.EYBIN_DTYPE)['tradenum'][0]) for record in records] == [42, 43, 44]
+
+#-- an eyxml trade converted to eybin parses back to the same fields & python types
+def test_eyxml_to_bin():
+    payloads = xmlutils.GenerateTradesEY(7,3,np.random.RandomState(2))
+    records = [xmlutils.EYXMLToBin(payload, tradenum) for tradenum, payload in enumerate(payloads, 7)]
+    for payload, record in zip(payloads, records):
+        trade = xmlutils.ParseEYXML(payload).loc[0].to_dict()
+        binary = xmlutils.ParseEYBIN(record)
+        assert binary.keys() == trade.keys()
+        for field in trade:
+            assert binary[field] == trade[field]
+    frame = xmlutils.ParseEYBINFrame(records)
+    assert list(frame.columns) == list(xmlutils.ParseEYXML(payloads[0]).columns)
+    assert frame['strike'].tolist() == [xmlutils.ParseEYXMLFast(payload)['strike'] for payload in payloads]
+
+#-- the per trade eyxml generator and the bulk eybin generator draw the same trade from the same seed
+@pytest.mark.parametrize("seed", [1, 5])
+def test_eybin_generator_matches_eyxml(seed):
+    np.random.seed(seed)
+    trade = xmlutils.ParseEYBIN(xmlutils.EYXMLToBin(xmlutils.GenerateTradeEY(3,1),3))
+    binary = xmlutils.ParseEYBIN(xmlutils.GenerateTradesEYBIN(3,1,np.random.RandomState(seed))[0])
+    for field in xmlutils.EYBIN_DTYPE.names[1:]:
+        assert binary[field] == pytest.approx(trade[field], rel=1e-9)
+
+#-- the fast parser: same fields, values & python types as the pandas parser row, same dtypes as a frame
+@pytest.mark.parametrize("generator", ["per trade", "bulk"])
+def test_fast_parser_matches_pandas(generator):
+    np.random.seed(4)
+    if generator == "per trade": payloads = [xmlutils.GenerateTradeEY(tradenum,1) for tradenum in range(4)]
+    else: payloads = xmlutils.GenerateTradesEY(0,4,np.random.RandomState(4))
+    for payload in payloads:
+        frame = xmlutils.ParseEYXML(payload)
+        trade = frame.loc[0].to_dict()
+        fast = xmlutils.ParseEYXMLFast(payload)
+        assert list(fast) == list(trade) == list(frame.columns)
+        for field in trade:
+            assert fast[field] == trade[field]
+            assert type(fast[field]) is type(trade[field])
+        assert pd.DataFrame([fast], columns=frame.columns).dtypes.to_dict() == frame.dtypes.to_dict()
+    with pytest.raises(ValueError):
+        xmlutils.ParseEYXMLFast(b"<AZFINSIM>\n</AZFINSIM>\n")
+
+#-- bulk generators: the same trades as the per trade generator from the same seed
+@pytest.mark.parametrize("seed", [1, 5])
+def test_bulk_generator_matches_per_trade(seed):
+    np.random.seed(seed)
+    assert xmlutils.GenerateTradeEY(3,1) == xmlutils.GenerateTradesEY(3,1,np.random.RandomState(seed))[0]
+
+#-- eyxml & eybin batches drawn from the same stream are the same trades
+def test_bulk_generator_parses():
+    payloads = xmlutils.GenerateTradesEY(10,5,np.random.RandomState(1))
+    records = xmlutils.GenerateTradesEYBIN(10,5,np.random.RandomState(1))
+    for tradenum, (payload, record) in enumerate(zip(payloads, records), 10):
+        assert payload.endswith(b">%010d</trade>\n</AZFINSIM>\n" % tradenum)
+        trade = xmlutils.ParseEYXMLFast(payload)
+        binary = xmlutils.ParseEYBIN(record)
+        for field in xmlutils.EYBIN_DTYPE.names[1:]:
+            assert binary[field] == pytest.approx(trade[field], rel=1e-15)
+
+#-- varxml: --nbytes of CDATA per trade, the bulk generator draws the same text as the per trade one
+@pytest.mark.parametrize("seed", [1, 5])
+def test_bulk_varxml_matches_per_trade(seed):
+    np.random.seed(seed)
+    #-- the legacy swap stream id comes from the python random module
+    swap_id = re.compile(rb'swapStream id="\w+"')
+    assert (swap_id.sub(b"", xmlutils.GenerateTrade(3,500)) ==
+            swap_id.sub(b"", xmlutils.GenerateTrades(3,1,500,np.random.RandomState(seed))[0]))
+
+@pytest.mark.parametrize("nbytes", [1, 1000, 1 << 20])
+def test_varxml_payload_size(nbytes):
+    payloads = xmlutils.GenerateTrades(0,2,nbytes,np.random.RandomState(1))
+    for tradenum, payload in enumerate(payloads):
+        cdata = re.search(rb"<CDATA>(.*)</CDATA>", payload, re.S).group(1)
+        assert len(cdata) == nbytes
+        assert re.fullmatch(rb"[A-Za-z0-9_-]*", cdata)
+        assert b'id="%010d"' % tradenum in payload
+    assert payloads[0] != payloads[1]
@@ -1,73 +1,584 @@
 import redis 
 #import hazelcast
+import bisect
+import concurrent.futures
+import hashlib
 import logging
+import os
 import random
+import sys
+import threading
+import time
+import numpy as np
 
 import azlog
+import fsstore
+import xmlutils
 
 log = azlog.getLogger(__name__)
 
-def SetupCacheConn(type,ip,port,key,ssl):
-    if (type=="redis"): 
+#-- connection pool settings: set from the cli with SetPoolOptions() before the first SetupCacheConn()
+pool_size = 16                  #-- max connections per pool
+pool_timeout = 20.0             #-- seconds to wait for a free connection (0 = fail at once when exhausted)
+socket_timeout = 30.0           #-- seconds per socket read/write
+socket_connect_timeout = 10.0   #-- seconds per connect (incl. TLS handshake)
+health_check_interval = 30      #-- PING idle connections older than this (seconds) before reuse
+
+#-- one shared pool per (host, port, ssl) per process: every client built by SetupCacheConn() shares it
+pools = {}
+pool_lock = threading.Lock()
+pool_stats = {'acquires': 0, 'acquire_time': 0.0, 'exhausted': 0, 'failed': 0}
+
+def SetPoolOptions(size,timeout,sock_timeout,health_interval):
+    global pool_size, pool_timeout, socket_timeout, health_check_interval
+    pool_size = size
+    pool_timeout = timeout
+    socket_timeout = sock_timeout
+    health_check_interval = health_interval
+
+def ResetPools():
+    ''' forget the pools & counters inherited from the parent: children open their own connections '''
+    global pools, pool_lock, pool_stats
+    pools = {}
+    pool_lock = threading.Lock()
+    pool_stats = {'acquires': 0, 'acquire_time': 0.0, 'exhausted': 0, 'failed': 0}
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=ResetPools)
+
+class PoolStatsMixin:
+    ''' counts connection acquires, acquire latency and pool exhaustion (no free connection) '''
+
+    def exhausted(self):
+        try:
+            if isinstance(self, redis.BlockingConnectionPool): return self.pool.empty()
+            return not self._available_connections and self._created_connections >= self.max_connections
+        except AttributeError:
+            return False
+
+    def get_connection(self, *args, **kwargs):
+        start = time.perf_counter()
+        exhausted = self.exhausted()
+        try:
+            return super().get_connection(*args, **kwargs)
+        except redis.ConnectionError:
+            with pool_lock: pool_stats['failed'] += 1
+            raise
+        finally:
+            with pool_lock:
+                pool_stats['acquires'] += 1
+                pool_stats['acquire_time'] += time.perf_counter() - start
+                if exhausted: pool_stats['exhausted'] += 1
+
+class StatsConnectionPool(PoolStatsMixin, redis.ConnectionPool):
+    pass
+
+class StatsBlockingConnectionPool(PoolStatsMixin, redis.BlockingConnectionPool):
+    pass
+
+def GetPool(ip,port,key,ssl):
+    with pool_lock:
+        pool = pools.get((ip,port,ssl))
+        if pool is None:
+            kwargs = dict(host=ip, port=port, password=key,
+                          max_connections=pool_size,
+                          socket_timeout=socket_timeout,
+                          socket_connect_timeout=socket_connect_timeout,
+                          socket_keepalive=True,
+                          health_check_interval=health_check_interval)
+            if (ssl == "yes"):
+                kwargs.update(connection_class=redis.SSLConnection, ssl_cert_reqs=u'none') #-- or specify location of certs
+            if (pool_timeout > 0): pool = StatsBlockingConnectionPool(timeout=pool_timeout, **kwargs)
+            else: pool = StatsConnectionPool(**kwargs)
+            pools[(ip,port,ssl)] = pool
+            log.debug("Cache connection pool: %s:%s ssl=%s size=%d" % (ip,port,ssl,pool_size))
+    return pool
+
+'''  pool counters for this process: acquires, mean acquire latency (s), exhaustion & failure counts
+'''
+def PoolStats():
+    with pool_lock:
+        stats = dict(pool_stats)
+    stats['acquire_mean'] = stats['acquire_time'] / max(stats['acquires'], 1)
+    return stats
+
+'''  fold another process's PoolStats() (e.g. a --workers pool worker) into this process's counters
+'''
+def AddPoolStats(stats):
+    with pool_lock:
+        for k in pool_stats: pool_stats[k] += stats[k]
+
+#-- redis key layout (--key-layout): flat = one string key per trade, hash = bucket_size trades per hash
+key_layout = "flat"
+bucket_size = 1000
+
+def SetKeyLayout(layout,size):
+    global key_layout, bucket_size
+    key_layout = layout
+    bucket_size = size
+
+def BucketKey(keyname):
+    ''' hash layout: ey0000042.xml -> hash "ey.xml:00000", field "42" '''
+    name, tradenum = fsstore.split_key(keyname)
+    return "%s:%05d" % (name, tradenum // bucket_size), str(tradenum)
+
+class BucketedCache:
+    ''' the redis client calls used here (get/mget/set/pipeline) mapped onto bucket hashes:
+        a window of trades is read or written with one HMGET/HSET per bucket '''
+
+    def __init__(self,r):
+        self.r = r
+
+    def __getattr__(self,name):
+        return getattr(self.r, name)
+
+    def get(self,keyname):
+        return self.r.hget(*BucketKey(keyname))
+
+    def mget(self,keynames):
+        buckets = {}
+        for i, keyname in enumerate(keynames):
+            hkey, field = BucketKey(keyname)
+            buckets.setdefault(hkey, []).append((i, field))
+        pipe = self.r.pipeline(transaction=False)
+        for hkey, fields in buckets.items():
+            pipe.hmget(hkey, [field for i, field in fields])
+        values = [None] * len(keynames)
+        for fields, bucket_values in zip(buckets.values(), pipe.execute()):
+            for (i, field), value in zip(fields, bucket_values):
+                values[i] = value
+        return values
+
+    def set(self,keyname,value):
+        return self.r.hset(*BucketKey(keyname), value)
+
+    def pipeline(self,transaction=False):
+        return BucketedPipeline(self.r)
+
+class BucketedPipeline:
+    ''' buffers set() calls: execute() sends one HSET (all fields) per bucket in a single round trip '''
+
+    def __init__(self,r):
+        self.r = r
+        self.buckets = {}
+
+    def set(self,keyname,value):
+        hkey, field = BucketKey(keyname)
+        self.buckets.setdefault(hkey, {})[field] = value
+        return self
+
+    def execute(self):
+        pipe = self.r.pipeline(transaction=False)
+        for hkey, mapping in self.buckets.items():
+            pipe.hset(hkey, mapping=mapping)
+        self.buckets = {}
+        return pipe.execute()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        self.buckets = {}
+
+def RingHash(name):
+    ''' position of a name on the consistent hash ring: same value in every process and run '''
+    return int.from_bytes(hashlib.md5(name.encode()).digest()[:8], "big")
+
+class ShardedCache:
+    ''' client side sharding over several cache endpoints: trades are range partitioned into ranges of
+        bucket_size trade numbers (the buckets of the hash layout, so a bucket never straddles two
+        shards) and each range is placed on a consistent hash ring of the endpoint names. An MGET block
+        of neighbouring trades mostly goes to one shard, a trade window still spreads over all the shards,
+        and adding or removing an endpoint only moves the ranges next to its ring points (~1/N of the
+        trades). Multi key calls are split per shard and the shards are called in parallel. '''
+
+    vnodes = 256    #-- ring points per endpoint: evens out the share of ranges each shard gets
+
+    def __init__(self,shards,names=None):
+        self.shards = shards
+        if names is None: names = [str(s) for s in range(len(shards))]
+        ring = sorted((RingHash("%s#%d" % (name, i)), s) for s, name in enumerate(names) for i in range(self.vnodes))
+        self.ring_points = [point for point, s in ring]
+        self.ring_shards = [s for point, s in ring]
+        self.ranges = {}    #-- range number -> shard, filled on first use
+        self.executor = concurrent.futures.ThreadPoolExecutor(len(shards), thread_name_prefix="shard")
+
+    def __getattr__(self,name):
+        return getattr(self.shards[0], name)
+
+    def shard(self,keyname):
+        name, tradenum = fsstore.split_key(keyname)
+        number = tradenum // bucket_size
+        s = self.ranges.get(number)
+        if s is None:
+            #-- first ring point clockwise of the range's hash
+            i = bisect.bisect(self.ring_points, RingHash("%d" % number)) % len(self.ring_points)
+            s = self.ranges[number] = self.ring_shards[i]
+        return s
+
+    def get(self,keyname):
+        return self.shards[self.shard(keyname)].get(keyname)
+
+    def mget(self,keynames):
+        groups = {}
+        for i, keyname in enumerate(keynames):
+            groups.setdefault(self.shard(keyname), []).append(i)
+        futures = {s: self.executor.submit(self.shards[s].mget, [keynames[i] for i in idx]) for s, idx in groups.items()}
+        values = [None] * len(keynames)
+        for s, idx in groups.items():
+            for i, value in zip(idx, futures[s].result()):
+                values[i] = value
+        return values
+
+    def set(self,keyname,value):
+        return self.shards[self.shard(keyname)].set(keyname,value)
+
+    def pipeline(self,transaction=False):
+        return ShardedPipeline(self)
+
+class ShardedPipeline:
+    ''' one pipeline per shard: execute() runs them in parallel '''
+
+    def __init__(self,cache):
+        self.cache = cache
+        self.pipes = {}
+
+    def set(self,keyname,value):
+        s = self.cache.shard(keyname)
+        if s not in self.pipes: self.pipes[s] = self.cache.shards[s].pipeline(transaction=False)
+        self.pipes[s].set(keyname,value)
+        return self
+
+    def execute(self):
+        futures = [self.cache.executor.submit(pipe.execute) for pipe in self.pipes.values()]
+        self.pipes = {}
+        return [result for future in futures for result in future.result()]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        self.pipes = {}
+
+class VirtualCache:
+    ''' --cache-type virtual: no cache at all. A trade is synthesised on read from (seed, trade number)
+        with the GenerateTradeEY distributions, so reads cost no I/O and give the same trade on every
+        node and every run; writes are dropped. eyxml & eybin keys only (anything else reads as missing). '''
+
+    def __init__(self,seed=None):
+        self.seed = 0 if seed is None else seed
+
+    def get(self,keyname):
+        name, tradenum = fsstore.split_key(keyname)
+        #-- counter based stream keyed by (seed, trade number): cheap to set up per trade, no shared state
+        rng = np.random.RandomState(np.random.Philox(key=[self.seed, tradenum]))
+        if (name == "ey.xml"): return xmlutils.GenerateTradesEY(tradenum,1,rng)[0]
+        if (name == "eyb.bin"): return xmlutils.GenerateTradesEYBIN(tradenum,1,rng)[0]
+        return None
+
+    def mget(self,keynames):
+        return [self.get(keyname) for keyname in keynames]
+
+    def set(self,keyname,value):
+        return True
+
+    def pipeline(self,transaction=False):
+        return VirtualPipeline()
+
+class VirtualPipeline:
+
+    def set(self,keyname,value):
+        return self
+
+    def execute(self):
+        return []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        pass
+
+def SetupCacheConn(type,ip,port,key,ssl,path="None",seed=None):
+    if (type=="redis" and "," in ip):
+        #-- --cache-name host1[:port1],host2[:port2],...: one client per shard
+        shards = []
+        names = []
+        for endpoint in ip.split(","):
+            host, _, shard_port = endpoint.strip().partition(":")
+            shards.append(SetupCacheConn(type,host,int(shard_port or port),key,ssl,path))
+            names.append("%s:%d" % (host,int(shard_port or port)))
+        r=ShardedCache(shards,names)
+    elif (type=="redis"): 
         if (ssl=="yes"): 
             r=SetupRedisSSLConn(ip,port,key)
         else: 
             r=SetupRedisConn(ip,port,key)
+        if (key_layout=="hash"):
+            r=BucketedCache(r)
+    elif (type=="filesystem"):
+        #-- packed segment store under --cache-path: same get/mget/set/pipeline calls as a redis client
+        r=fsstore.FileStore(path)
+    elif (type=="virtual"):
+        #-- trades synthesised from (seed, trade number) on read: compute only runs, no cache needed
+        r=VirtualCache(seed)
     else:
         print("working on it. not yet supported...")
     return r
 
 def SetupRedisConn(ip,port,key):
-    r = redis.Redis(
-    host=ip,
-    port=port,
-    password=key)
+    r = redis.Redis(connection_pool=GetPool(ip,port,key,"no"))
     return r
 
 def SetupRedisSSLConn(ip,port,key):
-    r = redis.StrictRedis(
-    host=ip,
-    port=port,
-    password=key,
-    ssl_cert_reqs=u'none', #-- or specify location of certs
-    ssl=True)
+    r = redis.StrictRedis(connection_pool=GetPool(ip,port,key,"yes"))
     return r
 
+#-- payload compression (--codec): a compressed value is CODEC_MAGIC + one codec id byte + the compressed
+#-- payload; values without the header are returned as stored, so mixed keyspaces keep working
+CODEC_MAGIC = b"\x89AZ"
+CODEC_IDS = {'zlib': b'z', 'lz4': b'4', 'zstd': b's'}
+CODEC_NAMES = {cid: name for name, cid in CODEC_IDS.items()}
+codec = "none"
+codec_level = -1                #-- -1 = the codec's default level
+codec_funcs = {}
+
+def CodecFuncs(name):
+    ''' (compress(data,level), decompress(data)) of a codec: lz4 & zstd are optional packages, imported on first use '''
+    funcs = codec_funcs.get(name)
+    if funcs is None:
+        if (name == "zlib"):
+            import zlib
+            funcs = (lambda data, level: zlib.compress(data, level), zlib.decompress)
+        elif (name == "lz4"):
+            import lz4.frame
+            funcs = (lambda data, level: lz4.frame.compress(data, compression_level=max(level,0)), lz4.frame.decompress)
+        elif (name == "zstd"):
+            import zstandard
+            funcs = (lambda data, level: zstandard.ZstdCompressor(level=level if level > 0 else 3).compress(data),
+                     lambda data: zstandard.ZstdDecompressor().decompress(data))
+        else:
+            raise ValueError("unknown codec: %s" % name)
+        codec_funcs[name] = funcs
+    return funcs
+
+def CodecAvailable(name):
+    try:
+        CodecFuncs(name)
+        return True
+    except ImportError:
+        return False
+
+def SetCodec(name,level=-1):
+    global codec, codec_level
+    if (name != "none" and not CodecAvailable(name)):
+        log.error("codec %s is not installed (pip install %s)" % (name, {'lz4': 'lz4', 'zstd': 'zstandard'}.get(name, name)))
+        raise ImportError("codec %s is not available" % name)
+    codec = name
+    codec_level = level
+
+def Encode(value,name=None):
+    ''' compress a payload with the job codec (or the given one) and prepend the codec header '''
+    name = name or codec
+    if (name == "none" or value is None): return value
+    if isinstance(value, str): value = value.encode()
+    return CODEC_MAGIC + CODEC_IDS[name] + CodecFuncs(name)[0](value, codec_level)
+
+def Decode(value):
+    ''' undo Encode(): the codec comes from the header, values without one are returned untouched (zero copy) '''
+    if (value is None or len(value) < 4 or bytes(value[:3]) != CODEC_MAGIC): return value
+    name = CODEC_NAMES.get(bytes(value[3:4]))
+    if name is None: return value
+    return CodecFuncs(name)[1](value[4:])
+
+#-- RESP bulk load files (--resp-file): the raw redis protocol of the SET commands (HSET for the hash key
+#-- layout) that would fill the cache, for "redis-cli --pipe". Each chunk is an independent gzip member or
+#-- zstd frame, so chunks written by any number of workers (or runs) concatenate into a valid file.
+RESP_SUFFIXES = {'.gz': 'gzip', '.zst': 'zstd'}
+
+def RespCommand(*args):
+    out = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if isinstance(arg, str): arg = arg.encode()
+        out += [b"$%d\r\n" % len(arg), bytes(arg), b"\r\n"]
+    return b"".join(out)
+
+def RespCompression(path,compress="auto"):
+    ''' auto = from the file suffix: .gz -> gzip, .zst -> zstd, anything else (or stdout) -> none '''
+    if (compress != "auto"): return compress
+    return RESP_SUFFIXES.get(os.path.splitext(path)[1], "none")
+
+def RespCompress(data,compress):
+    if (compress == "gzip"):
+        import gzip
+        return gzip.compress(data, compresslevel=6)
+    elif (compress == "zstd"):
+        import zstandard
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return data
+
+def OpenResp(path):
+    if (path == "-"): return sys.stdout.buffer
+    return open(path, "wb")
+
+class RespBuffer:
+    ''' pipeline-like sink: set() records the RESP command instead of sending it,
+        chunk() returns the (compressed) commands recorded so far '''
+
+    def __init__(self, compress="none"):
+        self.compress = compress
+        self.commands = []
+
+    def set(self, key, value):
+        if (key_layout == "hash"): self.commands.append(RespCommand("HSET", *BucketKey(key), value))
+        else: self.commands.append(RespCommand("SET", key, value))
+        return self
+
+    def chunk(self):
+        data = RespCompress(b"".join(self.commands), self.compress)
+        self.commands = []
+        return data
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.commands = []
+
+#-- cache key prefix & suffix of each trade format: <prefix><7 digit trade number><suffix>
+KEY_FORMATS = {'eyxml': ('ey', '.xml'), 'varxml': ('var', '.xml'), 'eybin': ('eyb', '.bin')}
+
+def TradeKey(format,tradenum):
+    prefix, suffix = KEY_FORMATS[format]
+    return "%s%007d%s" % (prefix, tradenum, suffix)
+
+def ScanKeys(r,pattern,count=1000):
+    ''' names of the keys matching a pattern (redis SCAN, every shard); flat key layout only '''
+    shards = r.shards if isinstance(r, ShardedCache) else [r]
+    for shard in shards:
+        if not hasattr(shard, "scan_iter") or isinstance(shard, BucketedCache):
+            raise ValueError("key scan needs the flat key layout on redis")
+        for keyname in shard.scan_iter(match=pattern, count=count):
+            yield keyname.decode() if isinstance(keyname, bytes) else keyname
+
 def GetTrade(r,keyname):
-    xmlstring = r.get(keyname)
+    xmlstring = Decode(r.get(keyname))
     return xmlstring
 
+'''  prefetching trade reader: yields the trades of the window in order, fetching them
+     from the cache "block" keys at a time with a single MGET round trip per block.
+     The latency of each block is logged & tracked (REDISBLOCK) when a telemetry client is given.
+     format = eyxml, varxml or eybin
+     tradenums = trade numbers to read, in order
+     copy = True: decode into bytes copies (the filesystem cache otherwise hands out zero copy views)
+     timed = True: yield (trade, read time) pairs, the time of the block's MGET & decode shared
+             evenly by its trades
+'''
+def PrefetchTrades(r,format,tradenums,block,tc=None,copy=False,timed=False):
+    tradenums = list(tradenums)
+    for first in range(0, len(tradenums), block):
+        keynames = [TradeKey(format, tradenum) for tradenum in tradenums[first:first+block]]
+        start = time.perf_counter()
+        xmlstrings = [Decode(xmlstring) for xmlstring in r.mget(keynames)]
+        if copy: xmlstrings = [xmlstring if xmlstring is None else bytes(xmlstring) for xmlstring in xmlstrings]
+        timedelta = time.perf_counter() - start
+        log.info("TRADE %10d: REDISBLOCK: %.12f (block of %d)" % (tradenums[first],timedelta,len(keynames)))
+        if tc is not None: tc.track_metric('REDISBLOCK', timedelta)
+        for xmlstring in xmlstrings:
+            if timed: yield xmlstring, timedelta/len(keynames)
+            else: yield xmlstring
+
 '''  cachetype = redis, nfs etc.
      io = "input" or "output"
      r = redis handle
-     format = eyxml or varxml
+     format = eyxml, varxml or eybin
      tradenum = trade number
-     xmlstring = the trade xml data
+     xmlstring = the trade xml data (or eybin record)
 '''
 def PutTrade(cache_type,io,r,format,tradenum,xmlstring):
-    if (format == "eyxml"):
-        prefix = "ey"
-    elif (format == "varxml"):
-        prefix = "var"
-    else:
+    if (format not in KEY_FORMATS):
         log.error("invalid format: %s" % format)
         return(1)
 
     if (io == "input"):
-        keyname = "%s%007d.xml" % (prefix, tradenum)
+        keyname = TradeKey(format, tradenum)
     elif (io == "output"):
-        keyname = "%s%007d_result.xml" % (prefix, tradenum)
+        keyname = "%s%007d_result%s" % (KEY_FORMATS[format][0], tradenum, KEY_FORMATS[format][1])
     else: 
         log.error("File format: %s; input/output only supported. " % format)
         return(1)
 
-    if (cache_type=="redis"):
-        r.set(keyname,xmlstring)
+    if (cache_type=="redis" or cache_type=="filesystem"):
+        r.set(keyname,Encode(xmlstring))
 
     log.debug("Trade %d: written as: %s:\n%s" % (tradenum,keyname,xmlstring))
 
     return r
 
+#-- compact per trade result record written back to the cache (little endian float64 fields, 64 bytes)
+#-- read back with np.frombuffer(value, RESULT_DTYPE) or GetResults()
+RESULT_DTYPE = np.dtype([('PV','<f8'), ('PV_time','<f8'), ('Delta','<f8'), ('Vega','<f8'),
+                         ('StdErr','<f8'), ('Paths','<f8'), ('Compute','<f8'), ('TradeTime','<f8')])
+
+def ResultKey(format,tradenum):
+    return "%s%007d_result" % (KEY_FORMATS[format][0], tradenum)
+
+#-- --algorithm stress: where each trade read is written back (same size as the trade)
+def StressKey(format,tradenum):
+    return "%s%007d_stress%s" % (KEY_FORMATS[format][0], tradenum, KEY_FORMATS[format][1])
+
+'''  buffered result write back: add() packs a trade's results (dict with RESULT_DTYPE fields,
+     missing fields are NaN) into a RESULT_DTYPE record; the buffer is written to the cache in a
+     single pipelined round trip (one SET per trade) every "batch" trades, or on the first add()
+     "interval" seconds (0 = off) after the last flush, and at close().
+'''
+class ResultWriter:
+
+    def __init__(self,cache_type,r,format,batch=64,interval=0.0,tc=None):
+        self.cache_type = cache_type
+        self.r = r
+        self.format = format
+        self.batch = max(batch, 1)
+        self.interval = interval
+        self.tc = tc
+        self.buffer = []
+        self.last_flush = time.time()
+
+    def add(self,tradenum,res):
+        record = np.full(1, np.nan, RESULT_DTYPE)
+        for field in RESULT_DTYPE.names:
+            if field in res: record[field] = res[field]
+        self.buffer.append((tradenum, record.tobytes()))
+        if (len(self.buffer) >= self.batch or
+            (self.interval > 0 and time.time() - self.last_flush >= self.interval)):
+            self.flush()
+
+    def flush(self):
+        self.last_flush = time.time()
+        if not self.buffer: return
+        start = time.perf_counter()
+        if (self.cache_type=="redis" or self.cache_type=="filesystem"):
+            pipe = self.r.pipeline(transaction=False)
+            for tradenum, value in self.buffer:
+                pipe.set(ResultKey(self.format,tradenum), value)
+            pipe.execute()
+        timedelta = time.perf_counter() - start
+        log.info("TRADE %10d: REDISWRITE: %.12f (batch of %d)" % (self.buffer[0][0],timedelta,len(self.buffer)))
+        if self.tc is not None: self.tc.track_metric('REDISWRITE', timedelta/len(self.buffer))
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+
+'''  read results written by ResultWriter back as a RESULT_DTYPE array (NaN rows for missing trades)
+'''
+def GetResults(r,format,tradenums):
+    values = r.mget([ResultKey(format,tradenum) for tradenum in tradenums])
+    out = np.full(len(values), np.nan, RESULT_DTYPE)
+    for i, value in enumerate(values):
+        if value is not None: out[i] = np.frombuffer(value, RESULT_DTYPE)[0]
+    return out
+
 def InjectRandomFail(failure):
     if random.uniform(0.0, 1.0) < failure:
        logging.error("RANDOM ERROR INJECTION: TASK EXIT WITH ERROR")
@@ -4,6 +4,7 @@ import datetime as dt
 import xml.etree.ElementTree as ET
 import string
 import random
+import re
 
 # CDATA hack
 def serialize_xml_with_CDATA(write, elem, qnames, namespaces, short_empty_elements, **kwargs):
@@ -38,6 +39,14 @@ def indent(elem, level=0):
 def id_generator(size=8, chars=string.ascii_uppercase + string.digits):
 	return ''.join(random.choice(chars) for _ in range(size))
 
+#-- varxml CDATA payload: 64 url safe characters, so every random byte maps to one character (byte & 63)
+CDATA_CHARS = (string.ascii_uppercase + string.ascii_lowercase + string.digits + "-_").encode()
+CDATA_TABLE = bytes(CDATA_CHARS[i & 63] for i in range(256))
+
+def RandomCDATA(nbytes,rng=np.random):
+    ''' nbytes of random text drawn in one go (rng.bytes), fast from KB up to MB payloads '''
+    return rng.bytes(nbytes).translate(CDATA_TABLE)
+
 def GenerateTrade(tradenum,nbytes):
     # just use the time now
     today = dt.date.today()
@@ -54,7 +63,7 @@ def GenerateTrade(tradenum,nbytes):
     trade.set("businessDate",stoday)
 
     #-- create random CDATA serial stream
-    randbuf = ''.join(random.choice(string.ascii_uppercase + string.ascii_lowercase + string.digits) for _ in range(nbytes))
+    randbuf = RandomCDATA(nbytes).decode()
     #print randbuf
     #print random.getrandbits(1024)
 
@@ -77,19 +86,16 @@ def GenerateTrade(tradenum,nbytes):
     xmlstring = ET.tostring(root, encoding="utf-8", method="xml")
     return(xmlstring)
 
-def GenerateTradeEY(tradenum,N):
-    # just use the time now
-    today = dt.date.today()
-    stoday = "%s" % (today)
-
-    tradeformatted = "%010d" % tradenum
+def RandomTradeColumnsEY(N,rng=np.random):
+    ''' draw the parameters of N random EY trades: column name -> N values
+        (rng: the global numpy random state, or a RandomState for a private stream) '''
     newFile = {}
-    newFile['fx1'] = np.random.rand(N)*0.12+0.8285
+    newFile['fx1'] = rng.rand(N)*0.12+0.8285
 
     newFile['start_date'] = [dt.date(2017,12,29)]*N
     newFile['end_date'] = [dt.date(2018,8,28)]*N
 
-    newFile['drift'] = np.random.rand(N)*0.2 - 0.1
+    newFile['drift'] = rng.rand(N)*0.2 - 0.1
     newFile['maturity'] = [0.20]*N
 
     t_steps = np.busday_count(dt.date(2017,12,29), dt.date(2018,8,28) )# number of working days between 29/12/2017 and 08/03/2018
@@ -102,15 +108,28 @@ def GenerateTradeEY(tradenum,N):
 
     newFile['ro'] = [0.000038413221829]*N # calibration value: 0.000038413221829   Vega01 value: 0.0000387714624899
     newFile['v'] = [0.00154807378604]*N
-    newFile['sigma1'] = np.random.rand(N) * 0.03 - 0.015 +  0.0808844481978
+    newFile['sigma1'] = rng.rand(N) * 0.03 - 0.015 +  0.0808844481978
 
-    newFile['warrantsNo'] = np.random.randint(30000,60000,N)
-    newFile['notionalPerWarr'] = np.random.rand(N)*100 + 950
+    newFile['warrantsNo'] = rng.randint(30000,60000,N)
+    newFile['notionalPerWarr'] = rng.rand(N)*100 + 950
     #newFile['strike'] = np.random.rand(N)*0.2 + 0.9
-    newFile['strike'] = np.random.rand(N)*0.12 + 0.7
- 
-    newFile = pd.DataFrame.from_dict(newFile)
+    newFile['strike'] = rng.rand(N)*0.12 + 0.7
+
+    return newFile
+
+def RandomTradesEY(N,rng=np.random):
+    ''' draw the parameters of N random EY trades (one row per trade) '''
+    newFile = pd.DataFrame.from_dict(RandomTradeColumnsEY(N,rng))
     #newFile.to_csv('XXXX.csv')
+    return newFile
+
+def GenerateTradeEY(tradenum,N):
+    # just use the time now
+    today = dt.date.today()
+    stoday = "%s" % (today)
+
+    tradeformatted = "%010d" % tradenum
+    newFile = RandomTradesEY(N)
 
     #aroot = etree.Element('data');
     root = ET.Element("AZFINSIM")
@@ -174,4 +193,95 @@ def ParseEYXML(xmlstring):
     #print(trade_data.to_string())
     #drift = trade_data.loc[0,'drift']
     #print(drift)
-    return(trade_data)
\ No newline at end of file
+    return(trade_data)
+
+
+
+#-- bulk varxml generation: same text as GenerateTrade, the CDATA of the whole batch drawn at once
+VAR_TEMPLATE = ('<AZFINSIMTRADE>\n  <AzFinsimSyntheticTradeData id="%010d" tradeType="SWAP" process="iso" location="Mars" businessDate="%s">\n'
+                '    <AdditionalData type="azfinsim01">\n      <CDATA>')
+VAR_TAIL = ('</CDATA>\n    </AdditionalData>\n    <AdditionalData type="azfinsim02">\n      <QuantLib>\n        <Assets>\n'
+            '          <swapStream id="%s">\n            <FORMULAE Asset_ProductName="FWDBOND">\n'
+            '              <Formula Asset_Formula_Date="%s" Asset_Formula="FWDBOND US12345ORG89" />\n'
+            '            </FORMULAE>\n          </swapStream>\n        </Assets>\n      </QuantLib>\n'
+            '    </AdditionalData>\n  </AzFinsimSyntheticTradeData>\n</AZFINSIMTRADE>\n')
+SWAP_ID_CHARS = np.frombuffer((string.ascii_uppercase + string.digits).encode(), np.uint8)
+
+def GenerateTrades(start_trade,N,nbytes,rng=np.random):
+    ''' varxml payloads of trades start_trade .. start_trade+N-1 with nbytes of CDATA each '''
+    stoday = "%s" % (dt.date.today())
+    blob = RandomCDATA(N*nbytes,rng)
+    swap_ids = SWAP_ID_CHARS[rng.randint(0, len(SWAP_ID_CHARS), (N,8))].tobytes()
+    return [b"".join([(VAR_TEMPLATE % (tradenum,stoday)).encode(), blob[i*nbytes:(i+1)*nbytes],
+                      (VAR_TAIL % (swap_ids[i*8:(i+1)*8].decode(),stoday)).encode()])
+            for i, tradenum in enumerate(range(start_trade, start_trade+N))]
+
+#-- bulk generation: one set of vectorized draws per batch & a string template per trade, same text as GenerateTradeEY
+EY_TEMPLATE = ('<AZFINSIM>\n  <trade fx1="%.16f" start_date="%s" end_date="%s" drift="%2.17f" maturity="%.2f" t_steps="%d" '
+               'trials="%d" ro="%2.10e" v="%2.16f" sigma1="%2.17f" warrantsNo="%d" notionalPerWarr="%2.16f" '
+               'strike="%2.16f">%010d</trade>\n</AZFINSIM>\n')
+
+def GenerateTradesEY(start_trade,N,rng=np.random):
+    ''' eyxml payloads of trades start_trade .. start_trade+N-1 '''
+    newFile = RandomTradeColumnsEY(N,rng)
+    columns = [np.asarray(newFile[name]).tolist() for name in ['fx1','start_date','end_date','drift','maturity','t_steps',
+                                                   'trials','ro','v','sigma1','warrantsNo','notionalPerWarr','strike']]
+    return [(EY_TEMPLATE % (row + (tradenum,))).encode()
+            for tradenum, row in zip(range(start_trade, start_trade+N), zip(*columns))]
+
+def GenerateTradesEYBIN(start_trade,N,rng=np.random):
+    ''' eybin payloads of trades start_trade .. start_trade+N-1 '''
+    newFile = RandomTradeColumnsEY(N,rng)
+    records = np.zeros(N, EYBIN_DTYPE)
+    records['tradenum'] = np.arange(start_trade, start_trade+N)
+    for name in EYBIN_DTYPE.names[1:]:
+        records[name] = newFile[name]
+    buf = records.tobytes()
+    size = EYBIN_DTYPE.itemsize
+    return [buf[i*size:(i+1)*size] for i in range(N)]
+
+#-- fast path: the first <trade> element's attributes straight to a dict (no element tree, no pandas)
+EY_FIELDS = {'fx1': float, 'start_date': str, 'end_date': str, 'drift': float, 'maturity': float,
+             't_steps': int, 'trials': int, 'ro': float, 'v': float, 'sigma1': float,
+             'warrantsNo': int, 'notionalPerWarr': float, 'strike': float}
+TRADE_RE = re.compile(rb'<trade\s([^>]*)>')
+ATTR_RE = re.compile(rb'(\w+)="([^"]*)"')
+
+def ParseEYXMLFast(xmlstring):
+    ''' same result as ParseEYXML(xmlstring).loc[0].to_dict() for generated trades: attribute
+        values are numbers & dates, so no xml entity decoding is done '''
+    if isinstance(xmlstring, str): xmlstring = xmlstring.encode()
+    m = TRADE_RE.search(xmlstring)
+    if m is None:
+        raise ValueError("no <trade> element in eyxml trade")
+    attrs = dict(ATTR_RE.findall(m.group(1)))
+    return {name: conv(attrs[name.encode()].decode()) for name, conv in EY_FIELDS.items()}
+
+#-- eybin: an EY trade as one fixed layout little endian record (100 bytes, no padding),
+#-- read zero copy with np.frombuffer(value, EYBIN_DTYPE)
+EYBIN_DTYPE = np.dtype([('tradenum','<i8'), ('fx1','<f8'), ('start_date','<M8[D]'), ('end_date','<M8[D]'),
+                        ('drift','<f8'), ('maturity','<f8'), ('t_steps','<i4'), ('trials','<i4'),
+                        ('ro','<f8'), ('v','<f8'), ('sigma1','<f8'), ('warrantsNo','<i4'),
+                        ('notionalPerWarr','<f8'), ('strike','<f8')])
+
+def EYXMLToBin(xmlstring,tradenum):
+    ''' convert an eyxml trade to eybin '''
+    trade_data = ParseEYXML(xmlstring)
+    records = np.zeros(len(trade_data), EYBIN_DTYPE)
+    records['tradenum'] = tradenum
+    for name in EYBIN_DTYPE.names[1:]:
+        records[name] = trade_data[name].values
+    return records.tobytes()
+
+def ParseEYBIN(buf):
+    ''' first trade of an eybin value as a dict, same fields & types as ParseEYXML(x).loc[0].to_dict() '''
+    values = np.frombuffer(buf, EYBIN_DTYPE, count=1)[0].item()
+    trade = dict(zip(EYBIN_DTYPE.names[1:], values[1:]))
+    trade['start_date'] = str(trade['start_date'])
+    trade['end_date'] = str(trade['end_date'])
+    return trade
+
+def ParseEYBINFrame(bufs):
+    ''' eybin values (one trade each) as a DataFrame with the ParseEYXML columns '''
+    records = np.frombuffer(b"".join(bufs), EYBIN_DTYPE)
+    return pd.DataFrame({name: records[name] for name in EYBIN_DTYPE.names[1:]})